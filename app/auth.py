@@ -1,44 +1,222 @@
 from datetime import datetime, timedelta
 from typing import Optional
+import asyncio
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from passlib.hash import bcrypt
+from fastapi import Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import settings
 from . import models
-from .database import get_db
-import os
-from dotenv import load_dotenv
+from .cache import user_cache, UserSnapshot
+from .database import get_db, get_read_db
+from .hashing import hashing_executor, HashingPoolBusy
+from .singleflight import user_lookups
+from .metrics import password_hash_duration_seconds
+import statistics
+import time
 
-load_dotenv()
 
 # Секретный ключ для JWT
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
+SECRET_KEY = settings.secret_key
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Токены со снимком профиля: GET /profile/ и /profile/status/ обслуживаются
+# прямо из подписанного токена, без кэша и БД. Цена - изменения профиля
+# (включая деактивацию) видны в таких токенах только после их перевыпуска
+TOKEN_PROFILE_CLAIMS = settings.token_profile_claims
+# Поля пользователя, которые попадают в токен
+PROFILE_CLAIM_FIELDS = (
+    "first_name", "last_name", "middle_name", "email", "is_active",
+    "deleted_at", "deletion_reason", "created_at", "updated_at",
+)
+
+# Стоимость bcrypt (log2 числа раундов, +1 удваивает время хэширования).
+# Подобрать под свое железо: python calibrate.py --target-ms 250
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+
+# Хэши с любой другой стоимостью считаются устаревшими (needs_update)
+# и перехэшируются при следующем успешном входе
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.hash(password)
+    finally:
+        password_hash_duration_seconds.observe(time.perf_counter() - started, "hash")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    finally:
+        password_hash_duration_seconds.observe(time.perf_counter() - started, "verify")
+
+
+def warm_up_password_hashing():
+    """
+    passlib загружает и проверяет backend bcrypt при первом хэшировании -
+    делаем это при старте, а не на первом входе
+    """
+    pwd_context.handler().get_backend()
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """
+    Проверка пароля и, если хэш устарел, новый хэш с текущей стоимостью.
+    Возвращает (пароль верный, новый хэш или None)
+    """
+    if not verify_password(plain_password, hashed_password):
+        return False, None
+    if not pwd_context.needs_update(hashed_password):
+        return True, None
+    return True, get_password_hash(plain_password)
+
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int = 4, max_rounds: int = 20,
+                            samples: int = 3) -> tuple[int, dict[int, float]]:
+    """
+    Подбирает максимальную стоимость bcrypt, при которой проверка пароля
+    на этой машине укладывается в target_ms.
+
+    Возвращает выбранную стоимость и медиану времени проверки (мс) для каждой
+    измеренной стоимости. Измерение останавливается на первой стоимости,
+    превысившей цель, - дальше время только удваивается.
+    """
+    password = "calibration-password"
+    timings = {}
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        hashed = bcrypt.using(rounds=rounds).hash(password)
+        durations = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            bcrypt.verify(password, hashed)
+            durations.append(time.perf_counter() - started)
+        timings[rounds] = statistics.median(durations) * 1000
+        if timings[rounds] > target_ms:
+            break
+        chosen = rounds
+    return chosen, timings
+
+
+def _hashing_busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Сервис перегружен, повторите попытку позже",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    Хэширование пароля в пуле хэширования, не блокируя event loop
+    """
+    try:
+        return await hashing_executor.run(get_password_hash, password)
+    except HashingPoolBusy:
+        raise _hashing_busy_exception()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Проверка пароля в пуле хэширования, не блокируя event loop
+    """
+    try:
+        return await hashing_executor.run(verify_password, plain_password, hashed_password)
+    except HashingPoolBusy:
+        raise _hashing_busy_exception()
 
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(models.User).filter(
-        models.User.email == email,
-        models.User.is_active == True  # Проверяем, что пользователь активен
-    ).first()
+def _hash_many(passwords: list[str]) -> list[str]:
+    return [get_password_hash(password) for password in passwords]
 
-    if not user:
+
+async def hash_passwords_async(passwords: list[str], chunk_size: int = 8) -> list[str]:
+    """
+    Параллельное хэширование списка паролей на всех потоках пула.
+
+    Пароли делятся на небольшие пачки, и одновременно выполняется не больше
+    пачек, чем потоков в пуле: так между пачками успевают пройти обычные логины.
+    """
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    in_flight = asyncio.Semaphore(max(hashing_executor.max_workers, 1))
+
+    async def hash_chunk(chunk):
+        async with in_flight:
+            try:
+                return await hashing_executor.run(_hash_many, chunk)
+            except HashingPoolBusy:
+                raise _hashing_busy_exception()
+
+    hashed_chunks = await asyncio.gather(*(hash_chunk(chunk) for chunk in chunks))
+    return [hashed for chunk in hashed_chunks for hashed in chunk]
+
+
+async def _store_rehashed_password(db: AsyncSession, user_id: int, old_hash: str, new_hash: str):
+    """
+    Записывает хэш с новой стоимостью одним UPDATE, без повторного чтения строки
+    """
+    try:
+        await db.execute(
+            update(models.User)
+            # Если пароль успели сменить параллельно, новый пароль не затираем
+            .where(models.User.id == user_id, models.User.hashed_password == old_hash)
+            # Перехэширование - не изменение профиля, updated_at оставляем как есть
+            .values(hashed_password=new_hash, updated_at=models.User.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    except SQLAlchemyError:
+        # Вход не должен падать из-за перехэширования - попробуем при следующем входе
+        await db.rollback()
+
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    """
+    Снимок пользователя при верном пароле, иначе False.
+
+    Одновременные входы с одним email читают строку одним запросом (single-flight)
+    """
+    async def load():
+        user = await db.scalar(
+            select(models.User).where(
+                models.User.email == email,
+                models.User.is_active == True  # Проверяем, что пользователь активен
+            ).limit(1)
+        )
+        if user is None:
+            return None
+        return UserSnapshot.from_user(user), user.hashed_password
+
+    found = await user_lookups.do(("login", email, db.bind, user_cache.load_token()), load)
+    if not found:
         return False
-    if not verify_password(password, user.hashed_password):
+    user, hashed_password = found
+    try:
+        verified, new_hash = await hashing_executor.run(
+            verify_and_update_password, password, hashed_password
+        )
+    except HashingPoolBusy:
+        raise _hashing_busy_exception()
+    if not verified:
         return False
+    if new_hash is not None:
+        await _store_rehashed_password(db, user.id, hashed_password, new_hash)
     return user
 
 
@@ -53,33 +231,125 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(
-        token: str = Depends(oauth2_scheme),
-        db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+def _claim_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def create_user_token(user: models.User, expires_delta: Optional[timedelta] = None) -> str:
+    """
+    Токен доступа пользователя. В режиме TOKEN_PROFILE_CLAIMS дополнительно
+    содержит версию профиля (ver) и снимок профиля (profile)
+    """
+    data = {"sub": str(user.id)}
+    if TOKEN_PROFILE_CLAIMS:
+        data["ver"] = user.profile_version
+        data["profile"] = {name: _claim_value(getattr(user, name)) for name in PROFILE_CLAIM_FIELDS}
+    return create_access_token(data=data, expires_delta=expires_delta)
+
+
+def set_refreshed_token(response: Response, user: models.User):
+    """
+    После изменения профиля старый токен со снимком больше не принимается
+    изменяющими эндпоинтами - новый токен отдается в заголовке X-Access-Token
+    """
+    if TOKEN_PROFILE_CLAIMS:
+        response.headers["X-Access-Token"] = create_user_token(
+            user, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Не удалось подтвердить учетные данные",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
+        if payload.get("sub") is None:
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return payload
 
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
-    if user is None:
-        raise credentials_exception
-    return user
 
-
-async def get_current_active_user(current_user = Depends(get_current_user)):
-    if not current_user.is_active:
+def _ensure_active(user):
+    if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Пользователь деактивирован"
         )
-    return current_user
+    return user
+
+
+async def get_current_user(
+        token: str = Depends(oauth2_scheme),
+        db: AsyncSession = Depends(get_read_db)
+) -> UserSnapshot:
+    """
+    Текущий пользователь для эндпоинтов только на чтение.
+
+    Снимок берется из токена (TOKEN_PROFILE_CLAIMS) или из кэша,
+    запрос к БД (к реплике) выполняется только при промахе - один на все
+    одновременные промахи по этому пользователю.
+    """
+    payload = _decode_token(token)
+    user_id = int(payload["sub"])
+
+    if TOKEN_PROFILE_CLAIMS and "profile" in payload:
+        return UserSnapshot.from_claims(user_id, payload["profile"], payload.get("ver"))
+
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    load_token = user_cache.load_token()
+
+    async def load():
+        user = await db.get(models.User, user_id)
+        return UserSnapshot.from_user(user) if user is not None else None
+
+    snapshot = await user_lookups.do(("current_user", user_id, db.bind, load_token), load)
+    if snapshot is None:
+        raise _credentials_exception()
+
+    user_cache.put(user_id, snapshot, load_token)
+    return snapshot
+
+
+async def get_current_user_for_update(
+        token: str = Depends(oauth2_scheme),
+        db: AsyncSession = Depends(get_db)
+) -> models.User:
+    """
+    Текущий пользователь для изменяющих эндпоинтов.
+
+    Всегда читает строку из БД (в обход кэша) и возвращает ORM-объект,
+    привязанный к сессии запроса.
+    """
+    payload = _decode_token(token)
+    user = await db.get(models.User, int(payload["sub"]))
+    if user is None:
+        raise _credentials_exception()
+    # Токен со снимком выдан для конкретной версии профиля: после изменения
+    # профиля, пароля или деактивации снимок в нем устарел
+    if "ver" in payload and payload["ver"] != user.profile_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Токен устарел, войдите заново",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
+async def get_current_active_user(current_user = Depends(get_current_user)):
+    return _ensure_active(current_user)
+
+
+async def get_current_active_user_for_update(
+        current_user = Depends(get_current_user_for_update)
+):
+    return _ensure_active(current_user)
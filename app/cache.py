@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+import threading
+import time
+from .config import settings
+
+
+# Максимум пользователей в кэше (0 - кэш выключен)
+USER_CACHE_SIZE = settings.user_cache_size
+# Время жизни записи в секундах. При нескольких воркерах это верхняя граница
+# того, насколько долго другой воркер может видеть устаревший профиль
+USER_CACHE_TTL = settings.user_cache_ttl
+
+
+class UserSnapshot:
+    """
+    Неизменяемый снимок пользователя для эндпоинтов только на чтение.
+
+    Хэш пароля в снимок намеренно не попадает.
+    """
+
+    __slots__ = (
+        "id", "first_name", "last_name", "middle_name", "email", "is_active",
+        "deleted_at", "deletion_reason", "created_at", "updated_at", "profile_version",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UserSnapshot is read-only")
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        return cls(**{name: getattr(user, name) for name in cls.__slots__})
+
+    @classmethod
+    def from_claims(cls, user_id: int, claims: dict, profile_version: int) -> "UserSnapshot":
+        """
+        Снимок из проверенного токена доступа (даты в токене - строки ISO 8601)
+        """
+        fields = dict(claims, id=user_id, profile_version=profile_version)
+        for name in ("deleted_at", "created_at", "updated_at"):
+            if isinstance(fields.get(name), str):
+                fields[name] = datetime.fromisoformat(fields[name])
+        return cls(**fields)
+
+
+class UserCache:
+    """
+    LRU-кэш снимков пользователей с TTL.
+
+    Записи явно сбрасываются через invalidate() после каждого изменения
+    строки пользователя.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[int, tuple[float, UserSnapshot]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def load_token(self) -> int:
+        """
+        Запоминается перед чтением из БД и передается в put(): если между
+        чтением и записью в кэш произошла инвалидация, прочитанные данные
+        могли устареть и в кэш не попадут
+        """
+        return self.invalidations
+
+    def put(self, user_id: int, snapshot: UserSnapshot, token: int):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if token != self.invalidations:
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self.invalidations += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
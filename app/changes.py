@@ -0,0 +1,99 @@
+"""
+Журнал изменений пользователей для GET /users/changes.
+
+Регистрация, изменение профиля, удаление, восстановление и очистка по сроку
+хранения добавляют строку в user_changes той же транзакцией, что и само
+изменение. Потребитель читает журнал по возрастанию seq, запоминает last_seq
+и синхронизируется за O(изменений), а не перечитывает всю таблицу.
+"""
+from typing import Optional
+import asyncio
+import orjson
+from sqlalchemy import select
+
+from .config import settings
+from . import models
+from .export import EXPORT_COLUMNS, EXPORT_FIELDS
+
+# Максимальное ожидание новых изменений (long polling), секунд
+CHANGES_MAX_WAIT = settings.changes_max_wait
+# Как часто перечитывать журнал во время ожидания: изменения, сделанные
+# другими воркерами, не будят ожидающие запросы этого воркера
+CHANGES_POLL_INTERVAL = settings.changes_poll_interval
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+RESTORED = "restored"
+PURGED = "purged"
+
+
+def record_change(db, user_id: int, operation: str):
+    """
+    Добавляет запись в журнал; сохраняется тем же commit, что и изменение
+    """
+    db.add(models.UserChange(user_id=user_id, operation=operation))
+
+
+def changes_statement(since: int, limit: int):
+    """
+    Изменения после since вместе с текущим состоянием пользователя
+    """
+    return (
+        select(
+            models.UserChange.seq,
+            models.UserChange.user_id,
+            models.UserChange.operation,
+            models.UserChange.changed_at,
+            *EXPORT_COLUMNS,
+        )
+        .select_from(models.UserChange)
+        .outerjoin(models.User, models.User.id == models.UserChange.user_id)
+        .where(models.UserChange.seq > since)
+        .order_by(models.UserChange.seq)
+        .limit(limit)
+    )
+
+
+def changes_to_json(rows, since: int) -> bytes:
+    changes = []
+    for row in rows:
+        user = None
+        # После очистки id в SQLite может достаться новому пользователю
+        if row.id is not None and row.operation != PURGED:
+            user = dict(zip(EXPORT_FIELDS, row[4:]))
+        changes.append({
+            "seq": row.seq,
+            "user_id": row.user_id,
+            "operation": row.operation,
+            "changed_at": row.changed_at,
+            "user": user,
+        })
+    return orjson.dumps({"changes": changes, "last_seq": rows[-1].seq if rows else since})
+
+
+class ChangeNotifier:
+    """
+    Будит запросы, ожидающие новых изменений, после commit в этом воркере
+    """
+
+    def __init__(self):
+        self._event: Optional[asyncio.Event] = None
+
+    def notify(self):
+        if self._event is not None:
+            self._event.set()
+            self._event = None
+
+    async def wait(self, timeout: float) -> bool:
+        if self._event is None:
+            self._event = asyncio.Event()
+        event = self._event
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+change_notifier = ChangeNotifier()
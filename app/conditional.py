@@ -0,0 +1,86 @@
+"""
+Условные GET запросы: ETag / If-None-Match, Last-Modified / If-Modified-Since
+и заголовок Cache-Control.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+import hashlib
+from fastapi import Request, Response, status
+from .config import settings
+
+
+# Cache-Control для общедоступных ответов (/users/, /users/{id}).
+# Например "public, max-age=5" позволяет прокси отдавать их без обращения к API
+CACHE_CONTROL_PUBLIC = settings.cache_control_public
+# Cache-Control для данных текущего пользователя (/profile/) - общие кэши их не хранят
+CACHE_CONTROL_PRIVATE = settings.cache_control_private
+
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"'
+
+
+def user_etag(user_id: int, created_at, profile_version) -> str:
+    """
+    Сильный ETag пользователя.
+
+    Вместо updated_at (в SQLite с точностью до секунды) используется
+    profile_version - она меняется при каждом изменении строки.
+    created_at отличает нового пользователя с переиспользованным id.
+    """
+    return _etag(f"{user_id}|{created_at}|{profile_version}".encode())
+
+
+def body_etag(body: bytes) -> str:
+    """
+    ETag готового тела ответа (для списков)
+    """
+    return _etag(body)
+
+
+def http_date(value: datetime) -> str:
+    # SQLite хранит CURRENT_TIMESTAMP в UTC без часового пояса
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def has_conditions(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Проверка условий запроса по RFC 9110: If-None-Match имеет приоритет,
+    If-Modified-Since учитывается только без него
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Для GET используется слабое сравнение: W/"x" совпадает с "x"
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
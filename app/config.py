@@ -0,0 +1,101 @@
+"""
+Настройки приложения.
+
+Переменные окружения и .env читаются один раз - при первом импорте app.config.
+Модули берут значения из settings; описание каждой переменной - в .env.example.
+"""
+from pathlib import Path
+from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    # .env в корне проекта (как раньше находил load_dotenv), независимо от текущего каталога
+    model_config = SettingsConfigDict(env_file=Path(__file__).resolve().parent.parent / ".env", extra="ignore")
+
+    # Запуск и старт приложения
+    server_mode: str = "prod"
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    web_concurrency: Optional[int] = None
+    server_keep_alive: int = 5
+    server_backlog: int = 2048
+    server_limit_concurrency: int = 0
+    server_graceful_timeout: int = 30
+    server_access_log: bool = True
+    migrate_on_startup: bool = False
+
+    # JWT
+    secret_key: str = "your-secret-key-here-change-in-production"
+    access_token_expire_minutes: int = 30
+    token_profile_claims: bool = False
+
+    # Пароли
+    bcrypt_rounds: int = 12
+    hashing_pool_size: Optional[int] = None
+    hashing_queue_size: Optional[int] = None
+
+    # База данных
+    database_url: str = "sqlite:///./users.db"
+    database_async: bool = True
+    async_database_url: Optional[str] = None
+    database_read_url: Optional[str] = None
+    async_database_read_url: Optional[str] = None
+    read_your_writes_seconds: float = 5
+    sqlite_pragmas: bool = True
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size: int = -65536
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_busy_timeout: int = 5000
+    db_pool_class: str = "queue"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = -1
+    db_pool_warm_up: Optional[int] = None
+    migration_chunk_size: int = 5000
+
+    # Кэши и ограничители
+    user_cache_size: int = 10000
+    user_cache_ttl: float = 30
+    single_flight_enabled: bool = True
+    email_filter_enabled: bool = True
+    email_filter_capacity: int = 1000000
+    email_filter_error_rate: float = 0.01
+    throttle_enabled: bool = True
+    throttle_email_per_minute: float = 5
+    throttle_email_burst: int = 5
+    throttle_ip_per_minute: float = 30
+    throttle_ip_burst: int = 20
+    throttle_max_keys: int = 100000
+    throttle_trust_forwarded: bool = False
+
+    # API
+    register_batch_max_size: int = 1000
+    cache_control_public: str = "no-cache"
+    cache_control_private: str = "private, no-cache"
+    changes_max_wait: float = 30
+    changes_poll_interval: float = 1
+    idempotency_store: str = "memory"
+    idempotency_ttl: float = 86400
+    idempotency_max_keys: int = 10000
+    idempotency_wait: float = 30
+
+    # Очистка удаленных пользователей
+    retention_days: int = 30
+    retention_mode: str = "delete"
+    retention_interval: float = 3600
+    retention_batch_size: int = 500
+    retention_batch_pause: float = 0.05
+    retention_max_run_seconds: float = 30
+
+    # Наблюдаемость
+    metrics_enabled: bool = True
+    sql_profiling: str = "off"
+    sql_profiling_token: Optional[str] = None
+    sql_slow_query_ms: float = 100
+    sql_repeat_threshold: int = 2
+
+
+settings = Settings()
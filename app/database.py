@@ -1,37 +1,454 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, pool
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+import threading
+import time
+from jose import JWTError, jwt
 
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
-load_dotenv()
+from .config import settings
+from . import profiling
+from .metrics import METRICS_ENABLED, db_pool_wait_seconds, instrument_engine
+
 
 # Для простоты используем SQLite
-SQLALCHEMY_DATABASE_URL = os.getenv(
-    "DATABASE_URL",
-    "sqlite:///./users.db"
+SQLALCHEMY_DATABASE_URL = settings.database_url
+
+# Асинхронный режим: запросы из эндпоинтов не блокируют event loop.
+# DATABASE_ASYNC=false возвращает синхронную сессию (запросы идут через пул потоков)
+DATABASE_ASYNC = settings.database_async
+
+# Асинхронные драйверы для синхронных URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    sqlite:///./users.db -> sqlite+aiosqlite:///./users.db,
+    postgresql://... -> postgresql+asyncpg://...
+    URL с уже указанным драйвером возвращается как есть.
+    """
+    parsed = make_url(url)
+    if "+" in parsed.drivername:
+        return url
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = settings.async_database_url or to_async_url(SQLALCHEMY_DATABASE_URL)
+
+# Реплика для эндпоинтов чтения (get_read_db). Например вторая база SQLite или
+# та же база только на чтение: sqlite:///file:./users.db?mode=ro&uri=true.
+# Без DATABASE_READ_URL все запросы идут в основную базу
+DATABASE_READ_URL = settings.database_read_url
+ASYNC_DATABASE_READ_URL = settings.async_database_read_url or (
+    to_async_url(DATABASE_READ_URL) if DATABASE_READ_URL else None
 )
+# Сколько секунд после изменения своих данных пользователь читает из основной базы
+# (read-your-writes). Должно быть больше отставания реплики
+READ_YOUR_WRITES_SECONDS = settings.read_your_writes_seconds
+
+
+# Профиль SQLite, применяется к каждому новому соединению.
+# SQLITE_PRAGMAS=false оставляет настройки SQLite по умолчанию
+SQLITE_PRAGMAS = settings.sqlite_pragmas
+# WAL: читатели не блокируют писателя и наоборот
+SQLITE_JOURNAL_MODE = settings.sqlite_journal_mode
+# NORMAL в режиме WAL безопасен и не делает fsync на каждый commit
+SQLITE_SYNCHRONOUS = settings.sqlite_synchronous
+# Отрицательное значение - размер в КиБ (по умолчанию 64 МиБ на соединение)
+SQLITE_CACHE_SIZE = settings.sqlite_cache_size
+SQLITE_MMAP_SIZE = settings.sqlite_mmap_size
+# Сколько миллисекунд ждать освобождения блокировки вместо "database is locked"
+SQLITE_BUSY_TIMEOUT = settings.sqlite_busy_timeout
+
+# Пул соединений: queue (по умолчанию), null (новое соединение на каждую сессию)
+# или static (одно общее соединение)
+DB_POOL_CLASS = settings.db_pool_class.lower()
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+DB_POOL_TIMEOUT = settings.db_pool_timeout
+DB_POOL_RECYCLE = settings.db_pool_recycle
+# Сколько соединений открыть при старте приложения (по умолчанию DB_POOL_SIZE, 0 - не открывать)
+DB_POOL_WARM_UP = settings.db_pool_warm_up if settings.db_pool_warm_up is not None else DB_POOL_SIZE
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_sqlite_file(url: str) -> bool:
+    database = make_url(url).database
+    return _is_sqlite(url) and database not in (None, "", ":memory:")
+
+
+def _connect_args(url: str) -> dict:
+    if _is_sqlite(url):
+        return {
+            "check_same_thread": False,  # Только для SQLite
+            "timeout": SQLITE_BUSY_TIMEOUT / 1000,
+        }
+    return {}
+
+
+def _timed_pool(base, engine_name: str):
+    """
+    Пул, замеряющий ожидание свободного соединения.
+
+    В SQLAlchemy нет события "перед выдачей соединения", поэтому замер
+    делается вокруг _do_get - именно там пул ждет освобождения соединения.
+    """
+    class TimedPool(base):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                db_pool_wait_seconds.observe(time.perf_counter() - started, engine_name)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def _pool_options(url: str, is_async: bool, engine_name: Optional[str] = None) -> dict:
+    if DB_POOL_CLASS == "null":
+        return {"poolclass": pool.NullPool}
+    if DB_POOL_CLASS == "static" or (_is_sqlite(url) and not _is_sqlite_file(url)):
+        # База в памяти живет, пока живо соединение - держим одно общее
+        return {"poolclass": pool.StaticPool}
+    poolclass = pool.AsyncAdaptedQueuePool if is_async else pool.QueuePool
+    if METRICS_ENABLED:
+        poolclass = _timed_pool(poolclass, engine_name or ("async" if is_async else "sync"))
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
 
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    finally:
+        cursor.close()
+
+
+def _apply_sqlite_read_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # journal_mode хранится в самом файле базы и задается основным движком
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        # Случайная запись через движок реплики завершится ошибкой
+        cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+def _configure_engine(sync_engine, url: str, engine_name: str, read_only: bool = False):
+    if SQLITE_PRAGMAS and _is_sqlite_file(url):
+        event.listen(sync_engine, "connect", _apply_sqlite_read_pragmas if read_only else _apply_sqlite_pragmas)
+    if METRICS_ENABLED:
+        instrument_engine(sync_engine, engine_name)
+    if profiling.SQL_PROFILING != "off":
+        profiling.instrument_engine(sync_engine)
+
+
+# Синхронный движок нужен миграциям, скриптам и режиму DATABASE_ASYNC=false
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}  # Только для SQLite
+    connect_args=_connect_args(SQLALCHEMY_DATABASE_URL),
+    **_pool_options(SQLALCHEMY_DATABASE_URL, is_async=False)
 )
+_configure_engine(engine, SQLALCHEMY_DATABASE_URL, "sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_ASYNC:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args=_connect_args(ASYNC_DATABASE_URL),
+        **_pool_options(ASYNC_DATABASE_URL, is_async=True)
+    )
+    _configure_engine(async_engine.sync_engine, ASYNC_DATABASE_URL, "async")
+    # expire_on_commit=False: после commit объекты остаются читаемыми
+    # без неявных (блокирующих) запросов к БД
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine,
+        autoflush=False,
+        expire_on_commit=False
+    )
+
+# Движки реплики; без DATABASE_READ_URL - те же, что и основные
+read_engine = engine
+async_read_engine = async_engine
+ReadSessionLocal = SessionLocal
+AsyncReadSessionLocal = AsyncSessionLocal
+if DATABASE_READ_URL:
+    read_engine = create_engine(
+        DATABASE_READ_URL,
+        connect_args=_connect_args(DATABASE_READ_URL),
+        **_pool_options(DATABASE_READ_URL, is_async=False, engine_name="sync_read")
+    )
+    _configure_engine(read_engine, DATABASE_READ_URL, "sync_read", read_only=True)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+    if DATABASE_ASYNC:
+        async_read_engine = create_async_engine(
+            ASYNC_DATABASE_READ_URL,
+            connect_args=_connect_args(ASYNC_DATABASE_READ_URL),
+            **_pool_options(ASYNC_DATABASE_READ_URL, is_async=True, engine_name="async_read")
+        )
+        _configure_engine(async_read_engine.sync_engine, ASYNC_DATABASE_READ_URL, "async_read", read_only=True)
+        AsyncReadSessionLocal = async_sessionmaker(
+            async_read_engine,
+            autoflush=False,
+            expire_on_commit=False
+        )
+
 Base = declarative_base()
 
 
-def get_db():
+class SyncSessionAdapter:
     """
-    Зависимость для получения сессии базы данных
+    Синхронная сессия с интерфейсом AsyncSession.
+
+    Используется при DATABASE_ASYNC=false: каждый запрос выполняется
+    в пуле потоков, поэтому эндпоинты пишутся одинаково для обоих режимов.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    def expunge(self, instance):
+        self.sync_session.expunge(instance)
+
+    async def execute(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, *args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, *args, **kwargs)
+
+    async def refresh(self, *args, **kwargs):
+        await run_in_threadpool(self.sync_session.refresh, *args, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+async def stream_rows(query, batch_size: int = 1000, read: bool = False):
+    """
+    Построчное чтение большого результата пачками по batch_size.
+
+    Использует серверный курсор (yield_per) на собственном соединении,
+    поэтому в памяти одновременно находится не больше одной пачки строк.
+    read=True читает из реплики.
     """
-    db = SessionLocal()
+    query = query.execution_options(yield_per=batch_size)
+    sync_engine, streaming_engine = (read_engine, async_read_engine) if read else (engine, async_engine)
+
+    if streaming_engine is not None:
+        async with streaming_engine.connect() as conn:
+            result = await conn.stream(query)
+            async for rows in result.partitions():
+                yield rows
+        return
+
+    conn = await run_in_threadpool(sync_engine.connect)
+    try:
+        partitions = (await run_in_threadpool(conn.execute, query)).partitions()
+        while True:
+            rows = await run_in_threadpool(next, partitions, None)
+            if rows is None:
+                break
+            yield rows
+    finally:
+        await run_in_threadpool(conn.close)
+
+
+def _warm_up_count(connection_pool) -> int:
+    if isinstance(connection_pool, pool.NullPool):
+        return 0
+    if isinstance(connection_pool, pool.QueuePool):
+        return min(DB_POOL_WARM_UP, connection_pool.size())
+    return min(DB_POOL_WARM_UP, 1)
+
+
+async def _warm_up_engine(sync_engine, warm_async_engine):
+    if warm_async_engine is not None:
+        count = _warm_up_count(warm_async_engine.sync_engine.pool)
+        connections = [await warm_async_engine.connect() for _ in range(count)]
+        for conn in connections:
+            await conn.close()
+        return
+
+    count = _warm_up_count(sync_engine.pool)
+    connections = [await run_in_threadpool(sync_engine.connect) for _ in range(count)]
+    for conn in connections:
+        await run_in_threadpool(conn.close)
+
+
+async def warm_up_engines():
+    """
+    Заранее открывает соединения пула (подключение и PRAGMA профиля SQLite),
+    чтобы первые запросы после старта не ждали их создания
+    """
+    await _warm_up_engine(engine, async_engine)
+    if DATABASE_READ_URL:
+        await _warm_up_engine(read_engine, async_read_engine)
+
+
+async def dispose_engines():
+    """
+    Закрывает все соединения пулов (при остановке приложения)
+    """
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
+    if DATABASE_READ_URL:
+        if async_read_engine is not None:
+            await async_read_engine.dispose()
+        read_engine.dispose()
+
+
+class RecentWrites:
+    """
+    Пользователи, недавно изменившие свои данные: в течение window секунд
+    их чтения идут в основную базу, а не в реплику, которая могла еще
+    не получить изменение. Хранится в памяти воркера.
+    """
+
+    def __init__(self, window: float, max_size: int = 100_000):
+        self.window = window
+        self.max_size = max_size
+        self._until: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mark(self, user_id: int):
+        if self.window <= 0:
+            return
+        with self._lock:
+            self._until[user_id] = time.monotonic() + self.window
+            self._until.move_to_end(user_id)
+            while len(self._until) > self.max_size:
+                self._until.popitem(last=False)
+
+    def active(self, user_id: int) -> bool:
+        until = self._until.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+# Без реплики отслеживать записи незачем
+recent_writes = RecentWrites(READ_YOUR_WRITES_SECONDS if DATABASE_READ_URL else 0)
+
+
+def _token_subject(request: Request) -> Optional[int]:
+    """
+    id пользователя из Bearer токена. Подпись здесь не проверяется:
+    от результата зависит только выбор базы, а не доступ к данным
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        subject = jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+    return int(subject) if isinstance(subject, str) and subject.isdigit() else None
+
+
+def _reads_own_write(request: Request) -> bool:
+    """
+    Запрос читает пользователя, изменившегося в последние READ_YOUR_WRITES_SECONDS:
+    сам пользователь (по токену) или GET /users/{user_id}
+    """
+    path_user_id = request.path_params.get("user_id")
+    if isinstance(path_user_id, str) and path_user_id.isdigit() and recent_writes.active(int(path_user_id)):
+        return True
+    user_id = _token_subject(request)
+    return user_id is not None and recent_writes.active(user_id)
+
+
+@asynccontextmanager
+async def _open_session(async_factory, sync_factory):
+    if async_factory is not None:
+        async with async_factory() as db:
+            yield db
+        return
+
+    db = SyncSessionAdapter(sync_factory(expire_on_commit=False))
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
 
+async def get_db():
+    """
+    Зависимость для получения сессии базы данных
+    """
+    async with _open_session(AsyncSessionLocal, SessionLocal) as db:
+        yield db
+
+
+async def get_read_db(request: Request):
+    """
+    Сессия для эндпоинтов только на чтение: реплика (DATABASE_READ_URL),
+    кроме чтения пользователем собственных недавних изменений
+    """
+    if DATABASE_READ_URL and not _reads_own_write(request):
+        factories = (AsyncReadSessionLocal, ReadSessionLocal)
+    else:
+        factories = (AsyncSessionLocal, SessionLocal)
+    async with _open_session(*factories) as db:
+        yield db
@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import math
+import threading
+from sqlalchemy import func, select
+from .config import settings
+from . import models
+from .database import stream_rows
+
+
+EMAIL_FILTER_ENABLED = settings.email_filter_enabled
+# На сколько email рассчитан фильтр (при прогреве увеличивается до 2x от числа строк)
+EMAIL_FILTER_CAPACITY = settings.email_filter_capacity
+# Целевая доля ложноположительных ответов
+EMAIL_FILTER_ERROR_RATE = settings.email_filter_error_rate
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+class EmailBloomFilter:
+    """
+    Фильтр Блума по нормализованным email.
+
+    might_contain() == False означает, что такого email точно нет в БД,
+    и проверку уникальности можно пропустить. True означает "возможно есть" -
+    тогда нужен обычный запрос к БД.
+
+    Удалить элемент из фильтра Блума нельзя: удаленные и замененные email
+    остаются в фильтре и дают лишь лишний запрос к БД до следующей перестройки.
+    Фильтр локален для процесса, поэтому окончательную уникальность
+    по-прежнему гарантирует уникальный индекс в БД.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.error_rate = error_rate
+        self.definitely_new = 0
+        self.probable_hits = 0
+        self.false_positives = 0
+        self._lock = threading.Lock()
+        self.reset(capacity)
+
+    def reset(self, capacity: int):
+        """
+        Очищает фильтр и пересчитывает его размер под новую емкость.
+        До повторного прогрева (ready = True) фильтр отвечает "возможно есть"
+        """
+        with self._lock:
+            self.ready = False
+            self.capacity = max(capacity, 1)
+            self.size_bits = max(8, int(-self.capacity * math.log(self.error_rate) / math.log(2) ** 2))
+            self.hash_count = max(1, round(self.size_bits / self.capacity * math.log(2)))
+            self.count = 0
+            self.removed = 0
+            self._bits = bytearray((self.size_bits + 7) // 8)
+
+    def _positions(self, email: str):
+        digest = hashlib.blake2b(normalize_email(email).encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size_bits for i in range(self.hash_count)]
+
+    def add(self, email: str):
+        with self._lock:
+            for position in self._positions(email):
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def discard(self, email: str):
+        """
+        Учитывает, что email больше не существует (фильтр Блума не умеет удалять)
+        """
+        with self._lock:
+            self.removed += 1
+
+    def might_contain(self, email: str) -> bool:
+        if not self.ready:
+            return True
+        found = all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(email)
+        )
+        if found:
+            self.probable_hits += 1
+        else:
+            self.definitely_new += 1
+        return found
+
+    def record_false_positive(self):
+        self.false_positives += 1
+
+    def estimated_error_rate(self) -> float:
+        return (1 - math.exp(-self.hash_count * self.count / self.size_bits)) ** self.hash_count
+
+    def stats(self) -> dict:
+        return {
+            "enabled": EMAIL_FILTER_ENABLED,
+            "ready": self.ready,
+            "count": self.count,
+            "removed": self.removed,
+            "capacity": self.capacity,
+            "hash_count": self.hash_count,
+            "memory_bytes": len(self._bits),
+            "target_error_rate": self.error_rate,
+            "estimated_error_rate": round(self.estimated_error_rate(), 6),
+            "definitely_new": self.definitely_new,
+            "probable_hits": self.probable_hits,
+            "false_positives": self.false_positives,
+        }
+
+
+# При EMAIL_FILTER_ENABLED=false фильтр никогда не прогревается
+# и всегда отвечает "возможно есть"
+email_filter = EmailBloomFilter(
+    EMAIL_FILTER_CAPACITY if EMAIL_FILTER_ENABLED else 1,
+    EMAIL_FILTER_ERROR_RATE
+)
+
+
+async def warm_email_filter(batch_size: int = 10_000) -> EmailBloomFilter:
+    """
+    Перестраивает фильтр потоковым чтением всех email из БД.
+
+    Вызывается при старте приложения, до приема запросов.
+    """
+    if not EMAIL_FILTER_ENABLED:
+        return email_filter
+
+    row_count = 0
+    async for rows in stream_rows(select(func.count()).select_from(models.User)):
+        row_count = rows[0][0]
+
+    email_filter.reset(max(EMAIL_FILTER_CAPACITY, row_count * 2))
+    async for rows in stream_rows(select(models.User.email), batch_size=batch_size):
+        for (email,) in rows:
+            email_filter.add(email)
+    email_filter.ready = True
+    stats = email_filter.stats()
+    logger.info(
+        "Фильтр email построен: %d адресов, %.1f МБ, ожидаемая доля ложноположительных %.4f",
+        stats["count"], stats["memory_bytes"] / 1024 / 1024, stats["estimated_error_rate"]
+    )
+    return email_filter
@@ -0,0 +1,63 @@
+from datetime import datetime
+import csv
+import io
+import orjson
+from fastapi import Response
+from . import models
+
+# Колонки выгрузки совпадают с полями UserResponse, поэтому они же
+# используются для быстрого чтения /users/ и /users/{id}
+EXPORT_COLUMNS = (
+    models.User.id,
+    models.User.first_name,
+    models.User.last_name,
+    models.User.middle_name,
+    models.User.email,
+    models.User.is_active,
+    models.User.created_at,
+    models.User.updated_at,
+)
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def rows_to_ndjson(rows) -> bytes:
+    return b"".join(orjson.dumps(dict(zip(EXPORT_FIELDS, row))) + b"\n" for row in rows)
+
+
+def csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_FIELDS)
+    return buffer.getvalue()
+
+
+def rows_to_csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in row
+        )
+    return buffer.getvalue()
+
+
+def rows_to_json(rows) -> bytes:
+    """
+    JSON-массив пользователей из строк EXPORT_COLUMNS.
+
+    Строки Core select() - это кортежи, они сериализуются напрямую через orjson,
+    без ORM-объектов и без построчной валидации через UserResponse.
+    Формат (в том числе дат) совпадает с ответом через response_model.
+    """
+    return orjson.dumps([dict(zip(EXPORT_FIELDS, row)) for row in rows])
+
+
+def row_to_json(row) -> bytes:
+    return orjson.dumps(dict(zip(EXPORT_FIELDS, row)))
+
+
+def json_response(content: bytes, **kwargs) -> Response:
+    """
+    Ответ с уже сериализованным JSON: FastAPI не прогоняет его через response_model
+    """
+    return Response(content=content, media_type="application/json", **kwargs)
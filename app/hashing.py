@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import asyncio
+import os
+import threading
+from .config import settings
+
+
+# Размер пула потоков для bcrypt (bcrypt отпускает GIL, поэтому потоки
+# реально работают параллельно на нескольких ядрах).
+# 0 - хэшировать прямо в event loop (старое поведение, только для сравнения)
+HASHING_POOL_SIZE = settings.hashing_pool_size if settings.hashing_pool_size is not None else (os.cpu_count() or 1)
+
+# Сколько операций может одновременно ждать/выполняться в пуле.
+# Всё, что сверх этого лимита, сразу отклоняется - так мы не копим очередь
+# из тысяч логинов, которые всё равно не успеют выполниться.
+HASHING_QUEUE_SIZE = settings.hashing_queue_size or max(HASHING_POOL_SIZE, 1) * 8
+
+
+class HashingPoolBusy(Exception):
+    """Очередь пула хэширования заполнена"""
+
+
+class HashingExecutor:
+    """
+    Ограниченный пул для тяжелых операций хэширования паролей.
+
+    Предоставляет awaitable API: работа выполняется в отдельных потоках,
+    а event loop в это время обслуживает остальные запросы.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # Операции в очереди или в работе (для метрик)
+        self.pending = 0
+        self.rejected = 0
+        self._pending_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="hashing"
+                    )
+        return self._executor
+
+    async def run(self, func: Callable, *args):
+        if self.max_workers <= 0:
+            return func(*args)
+
+        # Backpressure: не ставим задачу в очередь, если она уже заполнена
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingPoolBusy()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._pending_lock:
+            self.pending += 1
+        # Callback висит на concurrent.futures.Future, а не на asyncio-обертке:
+        # отмена корутины (клиент отключился) отменяет обертку сразу, а слот
+        # должен освободиться только когда поток действительно закончил работу
+        # (или задача снята из очереди, не начавшись)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        # Вызывается из потока пула
+        with self._pending_lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+hashing_executor = HashingExecutor(HASHING_POOL_SIZE, HASHING_QUEUE_SIZE)
@@ -0,0 +1,336 @@
+"""
+Идемпотентные повторы дорогих запросов по заголовку Idempotency-Key.
+
+Первый запрос с ключом выполняется как обычно, его ответ сохраняется на
+IDEMPOTENCY_TTL секунд. Повтор с тем же ключом получает сохраненный ответ
+(с заголовком Idempotent-Replayed: true) без повторного bcrypt и записи в БД.
+Одновременные дубликаты ждут завершения первого запроса.
+
+Ключ действует в пределах метода, пути и заголовка Authorization; повтор
+ключа с другим телом запроса отклоняется (422).
+
+IDEMPOTENCY_STORE=memory - ответы хранятся в LRU воркера.
+IDEMPOTENCY_STORE=database - дополнительно в таблице idempotency_keys, общей
+для всех воркеров (ключ занимается строкой со status_code = NULL).
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from .config import settings
+from . import models
+from .database import engine
+
+# Сколько секунд хранится ответ
+IDEMPOTENCY_TTL = settings.idempotency_ttl
+# Максимум ответов в памяти воркера
+IDEMPOTENCY_MAX_KEYS = settings.idempotency_max_keys
+# memory или database
+IDEMPOTENCY_STORE = settings.idempotency_store.lower()
+# Сколько дубликат ждет завершения первого запроса, прежде чем получить 409
+IDEMPOTENCY_WAIT = settings.idempotency_wait
+
+HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+# Эндпоинты с дорогим хэшированием пароля и записью в БД
+IDEMPOTENT_ENDPOINTS = {
+    ("POST", "/register/"),
+    ("POST", "/register/batch"),
+    ("PATCH", "/profile/password/"),
+}
+
+# Временные отказы не сохраняются: повтор должен выполниться заново
+_TRANSIENT_STATUSES = {408, 409, 425, 429}
+# Заголовки ответа, которые повторяются при воспроизведении
+_SKIPPED_HEADERS = {b"content-length", b"date", b"server"}
+# Как часто проверять ключ, занятый другим воркером
+_POLL_INTERVAL = 0.05
+# Ключ, занятый упавшим воркером, освобождается через это время
+_CLAIM_TIMEOUT = 60
+# Удаление просроченных строк таблицы - раз в столько сохраненных ответов
+_CLEANUP_EVERY = 100
+
+logger = logging.getLogger(__name__)
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status_code", "headers", "body")
+
+    def __init__(self, fingerprint: str, status_code: int, headers: list, body: bytes):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+
+class KeyInProgress(Exception):
+    """Запрос с этим ключом еще выполняется (в другом воркере)"""
+
+
+class IdempotencyStore:
+    def __init__(self, max_size: int, ttl: float, use_database: bool):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.use_database = use_database
+        self.replays = 0
+        self._entries: "OrderedDict[str, tuple[float, StoredResponse]]" = OrderedDict()
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._saved = 0
+
+    def _get_local(self, key: str) -> Optional[StoredResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _put_local(self, key: str, stored: StoredResponse):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def begin(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        None - ключ занят этим запросом, его нужно выполнить и вызвать finish().
+        Иначе - сохраненный ответ для повтора.
+        """
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        while True:
+            stored = self._get_local(key)
+            if stored is not None:
+                return stored
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                # Дубликат в этом же воркере: ждем первый запрос и проверяем снова
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise KeyInProgress()
+                try:
+                    await asyncio.wait_for(asyncio.shield(in_flight), remaining)
+                except asyncio.TimeoutError:
+                    raise KeyInProgress()
+                continue
+
+            if self.use_database:
+                stored = await asyncio.to_thread(_claim, key, fingerprint)
+                if stored is _BUSY:
+                    if time.monotonic() >= deadline:
+                        raise KeyInProgress()
+                    await asyncio.sleep(_POLL_INTERVAL)
+                    continue
+                if stored is not None:
+                    self._put_local(key, stored)
+                    return stored
+
+            self._in_flight[key] = asyncio.get_running_loop().create_future()
+            return None
+
+    async def finish(self, key: str, stored: Optional[StoredResponse]):
+        """
+        Сохраняет ответ (или освобождает ключ, если stored=None)
+        и будит ожидающие дубликаты
+        """
+        try:
+            if stored is not None:
+                self._put_local(key, stored)
+            if self.use_database:
+                self._saved += 1
+                cleanup = self._saved % _CLEANUP_EVERY == 0
+                await asyncio.to_thread(_save, key, stored, self.ttl, cleanup)
+        except SQLAlchemyError:
+            # Ответ уже отдан клиенту; повтор в другом воркере выполнится заново
+            logger.exception("Не удалось сохранить ответ для Idempotency-Key")
+        finally:
+            future = self._in_flight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "in_flight": len(self._in_flight), "replays": self.replays}
+
+
+_BUSY = object()
+
+
+def _claim(key: str, fingerprint: str):
+    """
+    Занимает ключ строкой без ответа. Возвращает None (ключ занят нами),
+    сохраненный ответ или _BUSY (ключ занят другим воркером)
+    """
+    table = models.IdempotencyKey.__table__
+    now = datetime.utcnow()
+    try:
+        with engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.key == key, table.c.expires_at < now))
+            conn.execute(insert(table).values(
+                key=key, fingerprint=fingerprint, expires_at=now + timedelta(seconds=_CLAIM_TIMEOUT)
+            ))
+        return None
+    except IntegrityError:
+        pass
+    with engine.connect() as conn:
+        row = conn.execute(select(table).where(table.c.key == key)).first()
+    if row is None:
+        # Строку только что удалили (первый запрос не сохранил ответ) - пробуем снова
+        return _BUSY
+    if row.status_code is None:
+        return _BUSY
+    return StoredResponse(row.fingerprint, row.status_code, json.loads(row.headers), row.body)
+
+
+def _save(key: str, stored: Optional[StoredResponse], ttl: float, cleanup: bool):
+    table = models.IdempotencyKey.__table__
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        if stored is None:
+            conn.execute(delete(table).where(table.c.key == key, table.c.status_code.is_(None)))
+        else:
+            conn.execute(update(table).where(table.c.key == key).values(
+                status_code=stored.status_code,
+                headers=json.dumps(stored.headers),
+                body=stored.body,
+                expires_at=now + timedelta(seconds=ttl),
+            ))
+        if cleanup:
+            conn.execute(delete(table).where(table.c.expires_at < now))
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL, IDEMPOTENCY_STORE == "database")
+
+
+def _hash(*parts: bytes) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+async def _error(send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _replay(send, stored: StoredResponse):
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers]
+    headers.append((b"content-length", str(len(stored.body)).encode()))
+    headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": stored.status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": stored.body})
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware: Idempotency-Key для IDEMPOTENT_ENDPOINTS.
+    Запросы без заголовка проходят без изменений.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in IDEMPOTENT_ENDPOINTS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        raw_key = headers.get(HEADER.encode())
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        # Повторы и ошибки ключа не доходят до роутера; пути IDEMPOTENT_ENDPOINTS
+        # без параметров, поэтому путь и есть шаблон маршрута для метрик
+        scope["route_path"] = scope["path"]
+        if not raw_key or len(raw_key) > MAX_KEY_LENGTH:
+            await _error(send, 400, f"Idempotency-Key должен содержать от 1 до {MAX_KEY_LENGTH} символов")
+            return
+
+        # Тело читается целиком: по нему проверяется, что ключ повторен с тем же запросом
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        method = scope["method"].encode()
+        path = scope["path"].encode()
+        authorization = headers.get(b"authorization", b"")
+        key = _hash(method, path, authorization, raw_key)
+        fingerprint = _hash(body)
+
+        try:
+            stored = await idempotency_store.begin(key, fingerprint)
+        except KeyInProgress:
+            await _error(send, 409, "Запрос с этим Idempotency-Key еще выполняется")
+            return
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                await _error(send, 422, "Idempotency-Key уже использован с другим телом запроса")
+                return
+            idempotency_store.replays += 1
+            await _replay(send, stored)
+            return
+
+        body_sent = False
+
+        async def replay_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response_status = None
+        response_headers = []
+        response_body = []
+
+        async def capture(message):
+            nonlocal response_status, response_headers
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+                response_headers = [
+                    (name.decode("latin-1"), value.decode("latin-1"))
+                    for name, value in message.get("headers", [])
+                    if name.lower() not in _SKIPPED_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        stored = None
+        try:
+            await self.app(scope, replay_body, capture)
+            if (response_status is not None and response_status < 500
+                    and response_status not in _TRANSIENT_STATUSES):
+                stored = StoredResponse(fingerprint, response_status, response_headers, b"".join(response_body))
+        finally:
+            await asyncio.shield(idempotency_store.finish(key, stored))
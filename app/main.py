@@ -1,29 +1,100 @@
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from typing import Optional
+from contextlib import asynccontextmanager
 from pathlib import Path
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import func
+from sqlalchemy import insert, select, text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
+from .config import settings
 from . import models, schemas
-from .database import engine, get_db
+from .database import (
+    engine, async_engine, read_engine, async_read_engine, DATABASE_READ_URL, get_db, get_read_db,
+    recent_writes, stream_rows, dispose_engines, warm_up_engines
+)
+from .export import (
+    EXPORT_COLUMNS, csv_header, json_response, row_to_json, rows_to_csv, rows_to_json, rows_to_ndjson
+)
 from .auth import (
-    authenticate_user, create_access_token,
-    get_current_active_user, get_password_hash,
-    ACCESS_TOKEN_EXPIRE_MINUTES, verify_password
+    authenticate_user, create_user_token, set_refreshed_token,
+    get_current_active_user, get_current_active_user_for_update, get_password_hash_async,
+    hash_passwords_async, warm_up_password_hashing,
+    ACCESS_TOKEN_EXPIRE_MINUTES, verify_password_async
+)
+from .cache import user_cache, UserSnapshot
+from .hashing import hashing_executor
+from .email_filter import email_filter, warm_email_filter
+from .pagination import (
+    encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor, next_page_link
+)
+from . import changes
+from .changes import (
+    CHANGES_MAX_WAIT, CHANGES_POLL_INTERVAL, change_notifier, changes_statement, changes_to_json, record_change
 )
+from .search import match_expression, search_statement, search_supported, MIN_TERM_LENGTH
+from .conditional import (
+    CACHE_CONTROL_PRIVATE, CACHE_CONTROL_PUBLIC, body_etag, has_conditions, is_not_modified,
+    not_modified, user_etag, validator_headers
+)
+from .throttle import login_throttle, throttle_password_attempt
+from .metrics import METRICS_ENABLED, MetricsMiddleware, registry, sample_lines
+from .profiling import SQL_PROFILING, SQLProfilingMiddleware
+from .retention import RETENTION_DAYS, retention_job
+from .singleflight import user_lookups
+from .idempotency import IdempotencyMiddleware, idempotency_store
+from .migrations import migrate
 from datetime import timedelta
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import asyncio
+import logging
+import time
 
-# Создаем таблицы в базе данных
-models.Base.metadata.create_all(bind=engine)
+# Максимальный размер пакета для POST /register/batch
+REGISTER_BATCH_MAX_SIZE = settings.register_batch_max_size
+# Попыток вставки пакета при конфликтах с параллельными регистрациями
+REGISTER_BATCH_ATTEMPTS = 3
+# Размер IN (...) при проверке существующих email
+EMAIL_LOOKUP_CHUNK = 500
 
 # Добавляем схему безопасности
 security = HTTPBearer()
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    app.state.ready = False
+    # Схему обычно обновляет run.py или migrate.py до запуска воркеров,
+    # MIGRATE_ON_STARTUP=true делает это здесь (uvicorn без run.py, тесты)
+    if settings.migrate_on_startup:
+        await asyncio.to_thread(migrate, engine, log=logging.getLogger("app.migrations").info)
+    # Прогрев до приема запросов: соединения пула, backend bcrypt, фильтр email
+    await warm_up_engines()
+    await hashing_executor.run(warm_up_password_hashing)
+    await warm_email_filter()
+    # Фоновая очистка давно удаленных пользователей
+    retention_job.start()
+    app.state.ready = True
+    logger.info("Приложение запущено за %.0f мс", (time.perf_counter() - started) * 1000)
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        await retention_job.stop()
+        # Дожидаемся уже начатых операций хэширования, не блокируя event loop
+        await asyncio.to_thread(hashing_executor.shutdown)
+        await dispose_engines()
+
+
 app = FastAPI(
     title="User Registration API",
     description="API для регистрации и управления пользователями",
     version="1.0.0",
+    lifespan=lifespan,
     # Добавляем настройки безопасности для Swagger
     swagger_ui_parameters={
         "syntaxHighlight.theme": "obsidian",
@@ -48,28 +119,118 @@ app = FastAPI(
 )
 
 
+def _collect_app_stats():
+    """
+    Состояние пулов, кэшей и ограничителей на момент запроса /metrics
+    """
+    engines = {"sync": engine}
+    if async_engine is not None:
+        engines["async"] = async_engine.sync_engine
+    if DATABASE_READ_URL:
+        engines["sync_read"] = read_engine
+        if async_read_engine is not None:
+            engines["async_read"] = async_read_engine.sync_engine
+    cache = user_cache.stats()
+    emails = email_filter.stats()
+    throttle = login_throttle.stats()
+    idempotency = idempotency_store.stats()
+    lookups = user_lookups.stats()
+    return [
+        *sample_lines("db_pool_checked_out", "Выданные соединения пула", {
+            name: getattr(eng.pool, "checkedout", lambda: 0)() for name, eng in engines.items()
+        }, labelname="engine"),
+        *sample_lines("password_hash_pending", "Операции bcrypt в очереди или в работе",
+                      hashing_executor.pending),
+        *sample_lines("password_hash_rejected_total", "Отказы пула хэширования (503)",
+                      hashing_executor.rejected, type="counter"),
+        *sample_lines("user_cache_requests_total", "Обращения к кэшу пользователей", {
+            "hit": cache["hits"], "miss": cache["misses"],
+        }, labelname="result", type="counter"),
+        *sample_lines("user_cache_size", "Записей в кэше пользователей", cache["size"]),
+        *sample_lines("user_lookups_executed_total", "Чтения пользователя, выполнившие SQL запрос",
+                      lookups["executed"], labelname="kind", type="counter"),
+        *sample_lines("user_lookups_coalesced_total", "Чтения пользователя, получившие результат чужого запроса",
+                      lookups["coalesced"], labelname="kind", type="counter"),
+        *sample_lines("email_filter_checks_total", "Проверки фильтра email", {
+            "definitely_new": emails.get("definitely_new", 0),
+            "probable_hit": emails.get("probable_hits", 0),
+            "false_positive": emails.get("false_positives", 0),
+        }, labelname="result", type="counter"),
+        *sample_lines("email_filter_items", "Email, добавленные в фильтр", emails.get("count", 0)),
+        *sample_lines("email_filter_memory_bytes", "Память битового массива фильтра email",
+                      emails.get("memory_bytes", 0)),
+        *sample_lines("email_filter_estimated_false_positive_rate",
+                      "Оценка доли ложноположительных ответов фильтра email",
+                      emails.get("estimated_error_rate", 0)),
+        *sample_lines("login_attempts_total", "Попытки проверки пароля", {
+            "allowed": throttle["allowed"],
+            "rejected_email": throttle["rejected_email"],
+            "rejected_ip": throttle["rejected_ip"],
+        }, labelname="result", type="counter"),
+        *sample_lines("retention_purged_users_total", "Пользователи, удаленные по истечении срока восстановления",
+                      retention_job.purged, type="counter"),
+        *sample_lines("idempotency_keys", "Сохраненные ответы Idempotency-Key в памяти", idempotency["size"]),
+        *sample_lines("idempotency_replays_total", "Повторы, получившие сохраненный ответ",
+                      idempotency["replays"], type="counter"),
+        *sample_lines("retention_runs_total", "Проходы очистки удаленных пользователей", {
+            "ok": retention_job.runs, "error": retention_job.errors,
+        }, labelname="result", type="counter"),
+    ]
+
+
+# Внутри MetricsMiddleware: повторы тоже попадают в метрики запросов
+app.add_middleware(IdempotencyMiddleware)
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    registry.add_collector(_collect_app_stats)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+if SQL_PROFILING != "off":
+    app.add_middleware(SQLProfilingMiddleware)
+
+
+def _email_exists_exception():
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Пользователь с таким email уже существует"
+    )
+
+
+async def _email_exists(db: AsyncSession, email: str) -> bool:
+    """
+    Проверка занятости email: сначала фильтр в памяти, к БД - только если
+    фильтр не может гарантировать, что email новый
+    """
+    if not email_filter.might_contain(email):
+        return False
+    exists = await db.scalar(
+        select(models.User.id).where(models.User.email == email).limit(1)
+    ) is not None
+    if not exists:
+        email_filter.record_false_positive()
+    return exists
+
+
 @app.post("/register/",
           response_model=schemas.UserResponse,
           status_code=status.HTTP_201_CREATED,
           tags=["Аутентификация"]
           )
-def register_user(
+async def register_user(
         user_data: schemas.UserCreate,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Регистрация нового пользователя
     """
     # Проверяем, существует ли уже пользователь с таким email
-    existing_user = db.query(models.User).filter(
-        models.User.email == user_data.email
-    ).first()
-
-    if existing_user:
-        raise HTTPException(
-            status_code=400,
-            detail="Пользователь с таким email уже существует"
-        )
+    if await _email_exists(db, user_data.email):
+        raise _email_exists_exception()
 
     # Проверяем совпадение паролей
     if user_data.password != user_data.password_repeat:
@@ -79,7 +240,7 @@ def register_user(
         )
 
     # Создаем нового пользователя
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
 
     db_user = models.User(
         first_name=user_data.first_name,
@@ -90,59 +251,359 @@ def register_user(
     )
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    try:
+        # id нужен для записи в журнал изменений той же транзакцией
+        await db.flush()
+        record_change(db, db_user.id, changes.CREATED)
+        await db.commit()
+    except IntegrityError:
+        # Email успели занять параллельно (например, через другой воркер)
+        await db.rollback()
+        raise _email_exists_exception()
+    email_filter.add(db_user.email)
+    recent_writes.mark(db_user.id)
+    change_notifier.notify()
 
     return db_user
 
 
+async def _existing_emails(db: AsyncSession, emails, use_filter: bool = True) -> set[str]:
+    if use_filter:
+        emails = [email for email in emails if email_filter.might_contain(email)]
+    else:
+        emails = list(emails)
+    existing = set()
+    for start in range(0, len(emails), EMAIL_LOOKUP_CHUNK):
+        chunk = emails[start:start + EMAIL_LOOKUP_CHUNK]
+        existing.update(await db.scalars(
+            select(models.User.email).where(models.User.email.in_(chunk))
+        ))
+    return existing
+
+
+@app.post("/register/batch",
+          response_model=schemas.BatchRegisterResponse,
+          tags=["Аутентификация"]
+          )
+async def register_users_batch(
+        users_data: list[schemas.UserCreate],
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Пакетная регистрация пользователей.
+
+    Проверяет дубликаты одним запросом, хэширует пароли параллельно
+    и вставляет всех пользователей одной транзакцией.
+    Ошибки отдельных элементов (дубликат email, несовпадение паролей)
+    не отменяют регистрацию остальных - результат возвращается по каждому элементу.
+    """
+    if len(users_data) > REGISTER_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Максимальный размер пакета: {REGISTER_BATCH_MAX_SIZE}"
+        )
+
+    results: list[schemas.BatchRegisterItem] = [
+        schemas.BatchRegisterItem(index=index, email=user_data.email, created=False)
+        for index, user_data in enumerate(users_data)
+    ]
+
+    existing = await _existing_emails(db, {user_data.email for user_data in users_data})
+    pending = []
+    seen = set()
+    for index, user_data in enumerate(users_data):
+        if user_data.email in existing or user_data.email in seen:
+            results[index].error = "Пользователь с таким email уже существует"
+        elif user_data.password != user_data.password_repeat:
+            results[index].error = "Пароли не совпадают"
+        else:
+            pending.append(index)
+            seen.add(user_data.email)
+
+    hashed_passwords = await hash_passwords_async(
+        [users_data[index].password for index in pending]
+    )
+    rows = {
+        index: {
+            "first_name": users_data[index].first_name,
+            "last_name": users_data[index].last_name,
+            "middle_name": users_data[index].middle_name,
+            "email": users_data[index].email,
+            "hashed_password": hashed_password,
+        }
+        for index, hashed_password in zip(pending, hashed_passwords)
+    }
+
+    # Если кто-то успел зарегистрировать один из email между проверкой
+    # и INSERT, такие элементы помечаются ошибкой и вставка повторяется
+    for attempt in range(REGISTER_BATCH_ATTEMPTS):
+        if not rows:
+            break
+        try:
+            created = (await db.scalars(
+                insert(models.User).returning(models.User),
+                list(rows.values())
+            )).all()
+            await db.execute(insert(models.UserChange), [
+                {"user_id": user.id, "operation": changes.CREATED} for user in created
+            ])
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            taken = await _existing_emails(
+                db, (row["email"] for row in rows.values()), use_filter=False
+            )
+            for index in [index for index, row in rows.items() if row["email"] in taken]:
+                results[index].error = "Пользователь с таким email уже существует"
+                del rows[index]
+            if not taken or attempt == REGISTER_BATCH_ATTEMPTS - 1:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Пакет конфликтует с параллельными регистрациями, повторите запрос"
+                )
+            continue
+
+        created_by_email = {user.email: user for user in created}
+        for user in created:
+            email_filter.add(user.email)
+            recent_writes.mark(user.id)
+        change_notifier.notify()
+        for index, row in rows.items():
+            results[index].created = True
+            results[index].user = schemas.UserResponse.model_validate(created_by_email[row["email"]])
+        break
+
+    created_count = sum(result.created for result in results)
+    return {
+        "created": created_count,
+        "failed": len(results) - created_count,
+        "results": results,
+    }
+
+
 @app.get("/users/", response_model=list[schemas.UserResponse], tags=["Пользователи"])
-def get_users(
+async def get_users(
+        request: Request,
         skip: int = 0,
         limit: int = 100,
         include_inactive: bool = False,
-        db: Session = Depends(get_db)
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить список пользователей.
 
     По умолчанию возвращаются только активные пользователи.
     Используйте параметр include_inactive=True для получения всех.
+
+    Для постраничного обхода используйте курсор: если страница заполнена,
+    ответ содержит заголовки X-Next-Cursor и Link (rel="next").
+    Курсор передается в параметре cursor, skip при этом игнорируется.
+
+    Ответ содержит ETag страницы: при совпадении If-None-Match возвращается 304.
     """
-    query = db.query(models.User)
+    # Только колонки ответа, без ORM-объектов (хэш пароля и причина удаления не читаются)
+    query = select(*EXPORT_COLUMNS)
 
     if not include_inactive:
-        query = query.filter(models.User.is_active == True)
+        query = query.where(models.User.is_active == True)
+
+    if cursor is not None:
+        # Keyset-пагинация: поиск по индексу (is_active, id) вместо OFFSET
+        query = query.where(models.User.id > decode_cursor(cursor))
+    else:
+        query = query.offset(skip)
+
+    rows = (await db.execute(query.order_by(models.User.id).limit(limit))).all()
+
+    body = rows_to_json(rows)
+    # Last-Modified для списка не отдается: пользователь может пропасть со страницы
+    # (деактивация), и максимальный updated_at при этом уменьшится
+    headers = validator_headers(body_etag(body), None, CACHE_CONTROL_PUBLIC)
+    if rows and len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1].id)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = next_page_link(
+            "/users/", next_cursor, limit=limit, include_inactive=include_inactive
+        )
+
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    return json_response(body, headers=headers)
+
+
+@app.get("/users/export", tags=["Пользователи"])
+async def export_users(
+        format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+        include_inactive: bool = False,
+        since: Optional[datetime] = None
+):
+    """
+    Потоковая выгрузка всех пользователей в формате NDJSON или CSV.
+
+    Строки читаются серверным курсором и отдаются клиенту пачками,
+    поэтому потребление памяти не зависит от размера таблицы.
+    Параметр since возвращает только пользователей, измененных начиная с этой даты.
+    """
+    query = select(*EXPORT_COLUMNS)
+
+    if not include_inactive:
+        query = query.where(models.User.is_active == True)
+    if since is not None:
+        query = query.where(models.User.updated_at >= since)
+
+    query = query.order_by(models.User.id)
+
+    if format == schemas.ExportFormat.csv:
+        async def content():
+            yield csv_header()
+            async for rows in stream_rows(query, read=True):
+                yield rows_to_csv(rows)
+
+        return StreamingResponse(
+            content(),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="users.csv"'}
+        )
+
+    async def content():
+        async for rows in stream_rows(query, read=True):
+            yield rows_to_ndjson(rows)
 
-    users = query.order_by(models.User.id).offset(skip).limit(limit).all()
-    return users
+    return StreamingResponse(content(), media_type="application/x-ndjson")
+
+
+@app.get("/users/changes", response_model=schemas.UserChangesResponse, tags=["Пользователи"])
+async def get_user_changes(
+        since: int = Query(0, ge=0),
+        limit: int = Query(100, ge=1, le=1000),
+        wait: float = Query(0, ge=0, le=CHANGES_MAX_WAIT),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Журнал изменений пользователей с номером больше since, по возрастанию номера.
+
+    Каждое изменение содержит операцию (created, updated, deleted, restored, purged)
+    и текущее состояние пользователя. last_seq из ответа передается в since
+    следующего запроса; since=0 возвращает журнал с начала.
+
+    wait - сколько секунд ждать новых изменений, если их пока нет (long polling).
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        rows = (await db.execute(changes_statement(since, limit))).all()
+        remaining = deadline - time.monotonic()
+        if rows or remaining <= 0:
+            break
+        # Завершаем транзакцию чтения: соединение возвращается в пул на время
+        # ожидания, а следующее чтение увидит изменения, сделанные после него
+        await db.rollback()
+        await change_notifier.wait(min(remaining, CHANGES_POLL_INTERVAL))
+    return json_response(changes_to_json(rows, since))
+
+
+@app.get("/users/search", response_model=list[schemas.UserResponse], tags=["Пользователи"])
+async def search_users(
+        q: str = Query(..., min_length=MIN_TERM_LENGTH, max_length=200),
+        limit: int = Query(20, ge=1, le=100),
+        include_inactive: bool = False,
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Поиск пользователей по имени, фамилии, отчеству и email.
+
+    Каждое слово запроса (от 3 символов) ищется как подстрока в любом из полей,
+    в выдаче должны встретиться все слова. Результаты упорядочены по релевантности.
+    Следующая страница - по курсору из заголовков X-Next-Cursor / Link.
+    """
+    if not search_supported(engine):
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Поиск доступен только для SQLite"
+        )
+
+    match = match_expression(q)
+    if match is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Запрос должен содержать слово не короче {MIN_TERM_LENGTH} символов"
+        )
+
+    params = {"match": match, "limit": limit}
+    if cursor is not None:
+        params["rank"], params["last_id"] = decode_rank_cursor(cursor)
+
+    statement = search_statement(include_inactive, after_cursor=cursor is not None)
+    rows = (await db.execute(statement, params)).all()
+
+    headers = {}
+    if rows and len(rows) == limit:
+        next_cursor = encode_rank_cursor(rows[-1].rank, rows[-1].id)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = next_page_link(
+            "/users/search", next_cursor, q=q, limit=limit, include_inactive=include_inactive
+        )
+
+    return json_response(rows_to_json(row[:len(EXPORT_COLUMNS)] for row in rows), headers=headers)
 
 
 @app.get("/users/{user_id}", response_model=schemas.UserResponse, tags=["Пользователи"])
-def get_user(
+async def get_user(
+        request: Request,
         user_id: int,
         include_inactive: bool = False,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить пользователя по ID.
 
     По умолчанию возвращаются только активные пользователи.
+    Поддерживает If-None-Match / If-Modified-Since (ответ 304).
+    Одновременные запросы одного пользователя читают строку одним SQL запросом.
     """
-    query = db.query(models.User).filter(models.User.id == user_id)
+    load_token = user_cache.load_token()
 
-    if not include_inactive:
-        query = query.filter(models.User.is_active == True)
+    def first_row(kind, query):
+        query = query.where(models.User.id == user_id)
+        if not include_inactive:
+            query = query.where(models.User.is_active == True)
 
-    user = query.first()
+        async def load():
+            return (await db.execute(query)).first()
 
-    if not user:
-        raise HTTPException(
+        return user_lookups.do((kind, user_id, include_inactive, db.bind, load_token), load)
+
+    def not_found():
+        return HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Пользователь не найден"
         )
 
-    return user
+    validators = (models.User.created_at, models.User.updated_at, models.User.profile_version)
+
+    if has_conditions(request):
+        # Сначала только валидаторы: если у клиента актуальная версия,
+        # строка целиком не читается и не сериализуется
+        current = await first_row("user_validators", select(*validators))
+        if not current:
+            raise not_found()
+        created_at, updated_at, profile_version = current
+        headers = validator_headers(
+            user_etag(user_id, created_at, profile_version), updated_at, CACHE_CONTROL_PUBLIC
+        )
+        if is_not_modified(request, headers["ETag"], updated_at):
+            return not_modified(headers)
+
+    row = await first_row("user", select(*EXPORT_COLUMNS, models.User.profile_version))
+
+    if not row:
+        raise not_found()
+
+    headers = validator_headers(
+        user_etag(row.id, row.created_at, row.profile_version), row.updated_at, CACHE_CONTROL_PUBLIC
+    )
+    return json_response(row_to_json(row[:len(EXPORT_COLUMNS)]), headers=headers)
 
 
 @app.get("/", include_in_schema=False)  # exclude_from_schema=True чтобы не показывать в документации
@@ -160,17 +621,35 @@ async def root():
     }
 
 
+@app.get("/health/ready", include_in_schema=False)
+async def health_ready(db: AsyncSession = Depends(get_db)):
+    """
+    Готовность принимать запросы: старт (прогрев) завершен и БД отвечает
+    """
+    if not getattr(app.state, "ready", False):
+        return JSONResponse({"status": "starting"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    try:
+        await db.execute(text("SELECT 1"))
+    except SQLAlchemyError:
+        return JSONResponse({"status": "database unavailable"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {"status": "ready"}
+
+
 @app.post("/login/", status_code=status.HTTP_200_OK, tags=["Аутентификация"])
 async def login(
+        request: Request,
         login_data: schemas.UserLogin,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Вход в систему по email и паролю.
 
     Возвращает JWT токен для доступа к защищенным эндпоинтам.
+    Слишком частые попытки для одного email или IP отклоняются с кодом 429.
     """
-    user = authenticate_user(db, login_data.email, login_data.password)
+    throttle_password_attempt(request, login_data.email)
+
+    user = await authenticate_user(db, login_data.email, login_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -179,9 +658,7 @@ async def login(
         )
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
-    )
+    access_token = create_user_token(user, expires_delta=access_token_expires)
 
     return {
         "access_token": access_token,
@@ -195,19 +672,64 @@ async def login(
 
 @app.get("/profile/", response_model=schemas.UserResponse, dependencies=[Depends(security)], tags=["Профиль"])
 async def get_profile(
-        current_user: models.User = Depends(get_current_active_user)
+        request: Request,
+        response: Response,
+        current_user: UserSnapshot = Depends(get_current_active_user)
 ):
     """
-    Получить профиль текущего пользователя
+    Получить профиль текущего пользователя.
+
+    Поддерживает If-None-Match / If-Modified-Since (ответ 304).
     """
+    headers = validator_headers(
+        user_etag(current_user.id, current_user.created_at, current_user.profile_version),
+        current_user.updated_at,
+        CACHE_CONTROL_PRIVATE,
+    )
+    headers["Vary"] = "Authorization"
+    if is_not_modified(request, headers["ETag"], current_user.updated_at):
+        return not_modified(headers)
+
+    response.headers.update(headers)
     return current_user
 
 
+async def _commit_user_change(db: AsyncSession):
+    """
+    Commit изменения строки пользователя. Если строку успели изменить
+    параллельно (profile_version уже другой), изменение отклоняется с 409
+    """
+    try:
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Профиль был изменен параллельно, повторите запрос"
+        )
+
+
+async def _commit_profile_update(db: AsyncSession, user: models.User, old_email: str):
+    record_change(db, user.id, changes.UPDATED)
+    try:
+        await _commit_user_change(db)
+    except IntegrityError:
+        await db.rollback()
+        raise _email_exists_exception()
+    user_cache.invalidate(user.id)
+    recent_writes.mark(user.id)
+    change_notifier.notify()
+    if user.email != old_email:
+        email_filter.add(user.email)
+        email_filter.discard(old_email)
+
+
 @app.patch("/profile/", response_model=schemas.UserResponse, dependencies=[Depends(security)], tags=["Профиль"])
 async def update_profile(
         user_update: schemas.UserUpdate,
-        current_user: models.User = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        response: Response,
+        current_user: models.User = Depends(get_current_active_user_for_update),
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Частичное обновление профиля пользователя
@@ -215,23 +737,19 @@ async def update_profile(
     update_data = user_update.dict(exclude_unset=True)
 
     # Если меняется email, проверяем что он уникальный
+    old_email = current_user.email
     if 'email' in update_data and update_data['email'] != current_user.email:
-        existing_user = (db.query(models.User)
-                         .filter(models.User.email == update_data['email'].lower())
-                         .first())
-        if existing_user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Пользователь с таким email уже существует"
-            )
+        if await _email_exists(db, update_data['email'].lower()):
+            raise _email_exists_exception()
         update_data['email'] = update_data['email'].lower()
 
     # Обновляем поля пользователя
     for field, value in update_data.items():
         setattr(current_user, field, value)
 
-    db.commit()
-    db.refresh(current_user)
+    await _commit_profile_update(db, current_user, old_email)
+    # updated_at уже получен из RETURNING (eager_defaults), перечитывать строку не нужно
+    set_refreshed_token(response, current_user)
 
     return current_user
 
@@ -239,22 +757,18 @@ async def update_profile(
 @app.put("/profile/", response_model=schemas.UserResponse, dependencies=[Depends(security)], tags=["Профиль"])
 async def update_profile_full(
         user_update: schemas.UserUpdateFull,
-        current_user: models.User = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        response: Response,
+        current_user: models.User = Depends(get_current_active_user_for_update),
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Полное обновление профиля пользователя (все поля обязательны)
     """
     # Проверяем email на уникальность если он меняется
+    old_email = current_user.email
     if user_update.email != current_user.email:
-        existing_user = db.query(models.User).filter(
-            models.User.email == user_update.email.lower()
-        ).first()
-        if existing_user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Пользователь с таким email уже существует"
-            )
+        if await _email_exists(db, user_update.email.lower()):
+            raise _email_exists_exception()
 
     # Обновляем все поля
     current_user.first_name = user_update.first_name
@@ -262,25 +776,25 @@ async def update_profile_full(
     current_user.middle_name = user_update.middle_name
     current_user.email = user_update.email.lower()
 
-    db.commit()
-    db.refresh(current_user)
+    await _commit_profile_update(db, current_user, old_email)
+    # updated_at уже получен из RETURNING (eager_defaults), перечитывать строку не нужно
+    set_refreshed_token(response, current_user)
 
     return current_user
 
 
 @app.patch("/profile/password/", dependencies=[Depends(security)], tags=["Профиль"])
-def change_password(
+async def change_password(
         password_data: schemas.PasswordChange,
-        current_user: models.User = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        response: Response,
+        current_user: models.User = Depends(get_current_active_user_for_update),
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Изменение пароля пользователя
     """
     # Проверяем старый пароль
-    from .auth import verify_password
-
-    if not verify_password(password_data.old_password, current_user.hashed_password):
+    if not await verify_password_async(password_data.old_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный текущий пароль"
@@ -301,10 +815,12 @@ def change_password(
         )
 
     # Обновляем пароль
-    from .auth import get_password_hash
-    current_user.hashed_password = get_password_hash(password_data.new_password)
+    current_user.hashed_password = await get_password_hash_async(password_data.new_password)
 
-    db.commit()
+    await _commit_user_change(db)
+    user_cache.invalidate(current_user.id)
+    recent_writes.mark(current_user.id)
+    set_refreshed_token(response, current_user)
 
     return {"message": "Пароль успешно изменен"}
 
@@ -315,20 +831,18 @@ def change_password(
             dependencies=[Depends(security)],
             tags=["Профиль"]
             )
-def delete_profile(
+async def delete_profile(
         delete_data: schemas.UserDeleteRequest,
-        current_user: models.User = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        current_user: models.User = Depends(get_current_active_user_for_update),
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Мягкое удаление профиля с подтверждением пароля.
 
     Требуется подтверждение текущим паролем для безопасности.
     """
-    from .auth import verify_password
-
     # Подтверждаем пароль
-    if not verify_password(delete_data.password, current_user.hashed_password):
+    if not await verify_password_async(delete_data.password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный пароль. Удаление отменено."
@@ -336,13 +850,20 @@ def delete_profile(
 
     # Помечаем пользователя как неактивного
     current_user.is_active = False
-    current_user.deleted_at = func.now()  # Устанавливаем время удаления
+    # Время удаления задается здесь, а не func.now(): значение SQL выражения
+    # пришлось бы перечитывать из БД после commit (время в UTC, как у server_default)
+    current_user.deleted_at = datetime.utcnow().replace(microsecond=0)
 
     # Сохраняем причину, если указана
     if delete_data.reason:
         current_user.deletion_reason = delete_data.reason
 
-    db.commit()
+    record_change(db, current_user.id, changes.DELETED)
+    await _commit_user_change(db)
+    # С этого момента закэшированный активный профиль больше не выдается
+    user_cache.invalidate(current_user.id)
+    recent_writes.mark(current_user.id)
+    change_notifier.notify()
 
     return {
         "message": "Профиль успешно деактивирован",
@@ -350,28 +871,32 @@ def delete_profile(
         "user_id": current_user.id,
         "email": current_user.email,
         "can_be_restored": True,
-        "restore_period_days": 30,
+        "restore_period_days": RETENTION_DAYS,
         "deleted_at": current_user.deleted_at
     }
 
 
 # endpoint для восстановления профиля
 @app.post("/profile/restore/", status_code=status.HTTP_200_OK, tags=["Профиль"])
-def restore_profile(
+async def restore_profile(
+        request: Request,
         email: str,
         password: str,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Восстановление деактивированного профиля.
 
     Пользователь может восстановить профиль в течение определенного периода.
     """
+    throttle_password_attempt(request, email)
 
-    user = db.query(models.User).filter(
-        models.User.email == email.lower(),
-        models.User.is_active == False
-    ).first()
+    user = await db.scalar(
+        select(models.User).where(
+            models.User.email == email.lower(),
+            models.User.is_active == False
+        ).limit(1)
+    )
 
     if not user:
         raise HTTPException(
@@ -380,7 +905,7 @@ def restore_profile(
         )
 
     # Проверяем пароль
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный пароль"
@@ -388,11 +913,14 @@ def restore_profile(
 
     # Восстанавливаем профиль
     user.is_active = True
-    db.commit()
+    record_change(db, user.id, changes.RESTORED)
+    await _commit_user_change(db)
+    user_cache.invalidate(user.id)
+    recent_writes.mark(user.id)
+    change_notifier.notify()
 
     # Создаем новый токен
-    from .auth import create_access_token
-    access_token = create_access_token(data={"sub": str(user.id)})
+    access_token = create_user_token(user)
 
     return {
         "message": "Профиль успешно восстановлен",
@@ -409,7 +937,7 @@ def restore_profile(
 
 @app.get("/profile/status/", dependencies=[Depends(security)], tags=["Профиль"])
 def get_profile_status(
-        current_user: models.User = Depends(get_current_active_user)
+        current_user: UserSnapshot = Depends(get_current_active_user)
 ):
     """
     Получить статус профиля пользователя.
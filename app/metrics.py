@@ -0,0 +1,234 @@
+"""
+Метрики в текстовом формате Prometheus.
+
+Собственная минимальная реализация счетчиков и гистограмм без внешних
+зависимостей: запись метрики - это поиск по словарю и несколько сложений
+под блокировкой, поэтому сбор можно держать включенным в production.
+"""
+from typing import Callable, Iterable
+import bisect
+import threading
+import time
+from sqlalchemy import event
+from .config import settings
+
+
+METRICS_ENABLED = settings.metrics_enabled
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labelvalues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # [счетчики по корзинам (последняя - +Inf), сумма, количество]
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(labels, list(state[0]), state[1], state[2]) for labels, state in self._values.items()]
+        lines = self.header()
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]):
+        """
+        Функция, которая на момент запроса /metrics возвращает готовые строки
+        (для значений, которые удобнее прочитать, чем считать на лету)
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "Количество HTTP запросов", ["method", "route", "status"]
+))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP запроса", ["method", "route"]
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP запросы в обработке"
+))
+db_queries_total = registry.register(Counter(
+    "db_queries_total", "Количество SQL запросов", ["engine"]
+))
+db_query_duration_seconds = registry.register(Histogram(
+    "db_query_duration_seconds", "Время выполнения SQL запроса", ["engine"]
+))
+db_pool_wait_seconds = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Ожидание свободного соединения в пуле", ["engine"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+))
+password_hash_duration_seconds = registry.register(Histogram(
+    "password_hash_duration_seconds", "Время bcrypt", ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+))
+
+
+def sample_lines(name: str, documentation: str, values, labelname: str = "", type: str = "gauge") -> list[str]:
+    """
+    Строки для значения, прочитанного в момент запроса /metrics:
+    одно число или словарь {значение метки labelname: число}
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {type}"]
+    if not isinstance(values, dict):
+        return lines + [f"{name} {_format_value(values)}"]
+    for labelvalue, value in values.items():
+        lines.append(f"{name}{_format_labels((labelname,), (labelvalue,))} {_format_value(value)}")
+    return lines
+
+
+def instrument_engine(sync_engine, engine_name: str):
+    """
+    Подписывается на события движка: количество и длительность SQL запросов
+    """
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_query_start"].pop()
+        db_queries_total.inc(engine_name)
+        db_query_duration_seconds.observe(time.perf_counter() - started, engine_name)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("metrics_query_start"):
+            conn.info["metrics_query_start"].pop()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: количество, длительность и число одновременных запросов.
+
+    Маршрут берется из шаблона пути (/users/{user_id}), а не из URL,
+    чтобы количество рядов метрики не росло с числом пользователей.
+    Middleware, отвечающие до роутера, указывают маршрут в scope["route_path"].
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            route_path = route.path if route is not None else scope.get("route_path", "unmatched")
+            method = scope["method"]
+            http_requests_total.inc(method, route_path, status_code)
+            http_request_duration_seconds.observe(elapsed, method, route_path)
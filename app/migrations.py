@@ -0,0 +1,218 @@
+"""
+Версионные миграции схемы.
+
+Каждая миграция выполняется один раз, ее номер записывается в schema_migrations
+вместе с длительностью. Миграции идемпотентны: базы, созданные через create_all
+или старым migrate.py, обновляются ими без ошибок.
+
+Запуск: python migrate.py (работает с DATABASE_URL приложения)
+"""
+from datetime import datetime
+from typing import Callable, Optional
+import time
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .config import settings
+from . import models
+from .changes import CREATED
+from .search import ensure_search_index
+
+
+# Строк в одной транзакции при заполнении данных
+MIGRATION_CHUNK_SIZE = settings.migration_chunk_size
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+    Column("duration_ms", Float, nullable=False),
+)
+
+
+class Migration:
+    """
+    transactional=True: apply(conn) выполняется в одной транзакции с записью версии.
+    transactional=False: apply(engine, log) сам управляет транзакциями
+    (построение индексов по большой таблице, заполнение данных пачками).
+    """
+
+    def __init__(self, version: int, name: str, apply: Callable, transactional: bool):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.transactional = transactional
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str, transactional: bool = True):
+    def register(func):
+        MIGRATIONS.append(Migration(version, name, func, transactional))
+        return func
+    return register
+
+
+def _has_column(conn, table: str, column: str) -> bool:
+    return column in {info["name"] for info in inspect(conn).get_columns(table)}
+
+
+def _add_column(conn, table: str, column: str, ddl: str):
+    if not _has_column(conn, table, column):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _create_index(conn, name: str, table: str, expression: str):
+    conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({expression})")
+
+
+def backfill_in_chunks(engine, table, values: dict, where, log: Callable[[str], None],
+                       chunk_size: int = MIGRATION_CHUNK_SIZE) -> int:
+    """
+    UPDATE table SET values WHERE where - пачками по chunk_size строк,
+    каждая пачка в своей транзакции, чтобы не держать блокировку записи.
+
+    Условие where должно перестать выполняться для обновленной строки,
+    иначе цикл не закончится. Прерванное заполнение безопасно продолжить.
+    """
+    total = 0
+    while True:
+        batch = select(table.c.id).where(where).limit(chunk_size)
+        with engine.begin() as conn:
+            updated = conn.execute(update(table).where(table.c.id.in_(batch)).values(values)).rowcount
+        if not updated:
+            return total
+        total += updated
+        log(f"    {table.name}: обновлено {total}")
+
+
+@migration(1, "create users table")
+def _create_users(conn):
+    # Для новой базы сразу создается актуальная схема (включая индексы модели),
+    # следующие миграции для нее ничего не меняют
+    models.User.__table__.create(conn, checkfirst=True)
+
+
+@migration(2, "add soft delete columns")
+def _soft_delete_columns(conn):
+    _add_column(conn, "users", "deleted_at", "TIMESTAMP")
+    _add_column(conn, "users", "deletion_reason", "VARCHAR(500)")
+
+
+@migration(3, "index users (is_active, id)", transactional=False)
+def _index_active_id(engine, log):
+    with engine.begin() as conn:
+        _create_index(conn, "ix_users_is_active_id", "users", "is_active, id")
+
+
+@migration(4, "add profile_version")
+def _profile_version(conn):
+    _add_column(conn, "users", "profile_version", "INTEGER NOT NULL DEFAULT 1")
+
+
+@migration(5, "full-text search index", transactional=False)
+def _search_index(engine, log):
+    ensure_search_index(engine)
+
+
+@migration(6, "retention: users_archive and index (is_active, deleted_at)", transactional=False)
+def _retention(engine, log):
+    with engine.begin() as conn:
+        models.ArchivedUser.__table__.create(conn, checkfirst=True)
+        _create_index(conn, "ix_users_is_active_deleted_at", "users", "is_active, deleted_at")
+
+
+@migration(7, "backfill deleted_at for deactivated users", transactional=False)
+def _backfill_deleted_at(engine, log):
+    # Пользователи, деактивированные до появления deleted_at, иначе
+    # никогда не попадут под очистку по сроку хранения
+    users = models.User.__table__
+    backfill_in_chunks(
+        engine,
+        users,
+        {"deleted_at": func.coalesce(users.c.updated_at, users.c.created_at, func.now())},
+        (users.c.is_active == False) & (users.c.deleted_at.is_(None)),
+        log,
+    )
+
+
+@migration(8, "user change feed", transactional=False)
+def _user_changes(engine, log):
+    # Существующие пользователи попадают в журнал как created, чтобы
+    # потребитель мог начать синхронизацию с since=0
+    changes = models.UserChange.__table__
+    users = models.User.__table__
+    with engine.begin() as conn:
+        changes.create(conn, checkfirst=True)
+        # Продолжение прерванного заполнения
+        last_id = conn.scalar(select(func.coalesce(func.max(changes.c.user_id), 0)))
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.scalars(
+                select(users.c.id).where(users.c.id > last_id).order_by(users.c.id).limit(MIGRATION_CHUNK_SIZE)
+            ).all()
+            if not ids:
+                return
+            conn.execute(insert(changes), [{"user_id": user_id, "operation": CREATED} for user_id in ids])
+        last_id = ids[-1]
+        total += len(ids)
+        log(f"    user_changes: добавлено {total}")
+
+
+@migration(9, "idempotency keys")
+def _idempotency_keys(conn):
+    models.IdempotencyKey.__table__.create(conn, checkfirst=True)
+
+
+def applied_versions(engine) -> set[int]:
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        return set(conn.scalars(select(schema_migrations.c.version)))
+
+
+def pending_migrations(engine) -> list[Migration]:
+    applied = applied_versions(engine)
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m.version) if m.version not in applied]
+
+
+def _record(conn, item: Migration, duration_ms: float):
+    conn.execute(schema_migrations.insert().values(
+        version=item.version,
+        name=item.name,
+        applied_at=datetime.utcnow(),
+        duration_ms=round(duration_ms, 2),
+    ))
+
+
+def migrate(engine, target: Optional[int] = None, log: Callable[[str], None] = lambda message: None) -> list[dict]:
+    """
+    Применяет все еще не примененные миграции (до target включительно).
+    Возвращает список примененных миграций с длительностью.
+    """
+    applied = []
+    for item in pending_migrations(engine):
+        if target is not None and item.version > target:
+            break
+        log(f"{item.version:04d} {item.name}...")
+        started = time.perf_counter()
+        try:
+            if item.transactional:
+                with engine.begin() as conn:
+                    item.apply(conn)
+                    _record(conn, item, (time.perf_counter() - started) * 1000)
+            else:
+                item.apply(engine, log)
+                with engine.begin() as conn:
+                    _record(conn, item, (time.perf_counter() - started) * 1000)
+        except IntegrityError:
+            # Ту же миграцию параллельно применил другой процесс
+            log(f"{item.version:04d} уже применена другим процессом")
+            continue
+        duration_ms = (time.perf_counter() - started) * 1000
+        log(f"{item.version:04d} {item.name}: {duration_ms:.1f} мс")
+        applied.append({"version": item.version, "name": item.name, "duration_ms": round(duration_ms, 2)})
+    return applied
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index, LargeBinary, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
@@ -7,6 +7,12 @@ Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Keyset-пагинация списка активных пользователей: WHERE is_active AND id > ?
+        Index("ix_users_is_active_id", "is_active", "id"),
+        # Очистка давно удаленных: WHERE is_active = 0 AND deleted_at < ?
+        Index("ix_users_is_active_deleted_at", "is_active", "deleted_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     first_name = Column(String(100), nullable=False)
@@ -25,3 +31,71 @@ class User(Base):
         server_default=func.now(),
         onupdate=func.now()
     )
+
+    # Версия профиля: увеличивается при каждом изменении строки через ORM
+    # (профиль, пароль, удаление и восстановление). Токены со снимком профиля
+    # несут эту версию, и изменяющие эндпоинты отклоняют токены со старой версией
+    profile_version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {
+        # UPDATE ... WHERE profile_version = ? - параллельная запись не затирается молча
+        "version_id_col": profile_version,
+        # updated_at и deleted_at возвращаются тем же UPDATE (RETURNING),
+        # без отдельного SELECT
+        "eager_defaults": True,
+    }
+
+
+class ArchivedUser(Base):
+    """
+    Пользователь, удаленный из users по истечении срока восстановления
+    (RETENTION_MODE=archive). Хэш пароля в архив не переносится.
+    """
+    __tablename__ = "users_archive"
+
+    archive_id = Column(Integer, primary_key=True)
+    # id в users (SQLite может переиспользовать id, поэтому не первичный ключ)
+    user_id = Column(Integer, nullable=False, index=True)
+    first_name = Column(String(100), nullable=False)
+    last_name = Column(String(100), nullable=False)
+    middle_name = Column(String(100), nullable=True)
+    email = Column(String(255), nullable=False)
+
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+    deletion_reason = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UserChange(Base):
+    """
+    Журнал изменений пользователей для GET /users/changes. Строки только
+    добавляются; AUTOINCREMENT гарантирует, что номера seq растут и не
+    переиспользуются после удаления строк.
+    """
+    __tablename__ = "user_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    # created, updated, deleted, restored, purged
+    operation = Column(String(20), nullable=False)
+    changed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class IdempotencyKey(Base):
+    """
+    Ответы на запросы с Idempotency-Key (IDEMPOTENCY_STORE=database).
+    Строка без status_code - запрос еще выполняется в одном из воркеров.
+    """
+    __tablename__ = "idempotency_keys"
+
+    # Хэш метода, пути, Authorization и самого ключа
+    key = Column(String(32), primary_key=True)
+    # Хэш тела запроса: повтор ключа с другим телом отклоняется
+    fingerprint = Column(String(32), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    headers = Column(Text, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,67 @@
+from typing import Optional
+from urllib.parse import quote
+import base64
+import json
+from fastapi import HTTPException, status
+
+
+def _encode(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _invalid_cursor():
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Некорректный курсор"
+    )
+
+
+def _decode(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(payload, dict) or not isinstance(payload.get("id"), int):
+            raise ValueError
+        return payload
+    except (ValueError, TypeError):
+        raise _invalid_cursor()
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Непрозрачный курсор: base64url от {"id": <последний id страницы>}
+    """
+    return _encode({"id": last_id})
+
+
+def decode_cursor(cursor: str) -> int:
+    return _decode(cursor)["id"]
+
+
+def encode_rank_cursor(rank: float, last_id: int) -> str:
+    """
+    Курсор для выдачи, упорядоченной по релевантности: {"rank": ..., "id": ...}
+    """
+    return _encode({"rank": rank, "id": last_id})
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    payload = _decode(cursor)
+    rank = payload.get("rank")
+    if not isinstance(rank, (int, float)) or isinstance(rank, bool):
+        raise _invalid_cursor()
+    return float(rank), payload["id"]
+
+
+def next_page_link(path: str, next_cursor: Optional[str], **params) -> Optional[str]:
+    """
+    Заголовок Link (RFC 8288) на следующую страницу
+    """
+    if next_cursor is None:
+        return None
+    query = "&".join(
+        f"{key}={quote(str(value).lower() if isinstance(value, bool) else str(value), safe='')}"
+        for key, value in {"cursor": next_cursor, **params}.items()
+    )
+    return f'<{path}?{query}>; rel="next"'
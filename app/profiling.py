@@ -0,0 +1,174 @@
+"""
+Профилирование SQL запросов в рамках одного HTTP запроса.
+
+Включается через SQL_PROFILING:
+    off    - выключено (по умолчанию, обработчики событий не подключаются)
+    header - только для запросов с заголовком X-DB-Profile: <SQL_PROFILING_TOKEN>
+             (без SQL_PROFILING_TOKEN не включается ни для одного запроса)
+    on     - для всех запросов
+
+Для профилируемого запроса в ответ добавляются X-DB-Queries и X-DB-Time,
+медленные запросы пишутся в лог вместе с планом выполнения, а одинаковые
+запросы, повторенные несколько раз (типичный N+1), - отдельным предупреждением.
+Значения параметров (email, хэши паролей) в лог не попадают.
+"""
+from contextvars import ContextVar
+from typing import Optional
+import hmac
+import logging
+import time
+from sqlalchemy import event
+from .config import settings
+
+
+SQL_PROFILING = settings.sql_profiling.lower()
+# Порог медленного запроса в миллисекундах
+SQL_SLOW_QUERY_MS = settings.sql_slow_query_ms
+# Сколько раз одинаковый запрос должен повториться, чтобы попасть в лог
+SQL_REPEAT_THRESHOLD = settings.sql_repeat_threshold
+
+# Секрет для SQL_PROFILING=header: профилирование включает только тот, кто его знает
+SQL_PROFILING_TOKEN = settings.sql_profiling_token
+
+PROFILE_HEADER = "x-db-profile"
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProfile:
+    """
+    Запросы, выполненные в рамках одного HTTP запроса
+    """
+
+    def __init__(self):
+        # (текст запроса, длительность в секундах)
+        self.queries: list[tuple[str, float]] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def total_time(self) -> float:
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold: int = SQL_REPEAT_THRESHOLD) -> dict[str, int]:
+        """
+        Одинаковые (с точностью до параметров) запросы, выполненные threshold раз и больше
+        """
+        counts: dict[str, int] = {}
+        for statement, _ in self.queries:
+            counts[statement] = counts.get(statement, 0) + 1
+        return {statement: n for statement, n in counts.items() if n >= threshold}
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("sql_profile", default=None)
+
+
+def current_profile() -> Optional[QueryProfile]:
+    return _current_profile.get()
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    """
+    План выполнения запроса через отдельный курсор того же соединения
+    (минуя события движка, чтобы EXPLAIN не попал в профиль)
+    """
+    if conn.dialect.name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN "
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if conn.dialect.name == "sqlite":
+        # (id, parent, notused, detail)
+        return "\n".join(f"  {row[-1]}" for row in rows)
+    return "\n".join(f"  {row[0]}" for row in rows)
+
+
+def instrument_engine(sync_engine):
+    """
+    Подписывается на события движка и записывает запросы в профиль текущего HTTP запроса
+    """
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        if profile is None or not conn.info.get("profile_query_start"):
+            return
+        duration = time.perf_counter() - conn.info["profile_query_start"].pop()
+        profile.queries.append((statement, duration))
+
+        if duration * 1000 < SQL_SLOW_QUERY_MS:
+            return
+        plan = ""
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            try:
+                plan = _explain(conn, statement, parameters)
+            except Exception as exc:
+                plan = f"  не удалось получить план: {exc}"
+        logger.warning("Медленный SQL запрос (%.1f мс): %s\n%s", duration * 1000, statement, plan)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("profile_query_start"):
+            conn.info["profile_query_start"].pop()
+
+
+def _should_profile(scope) -> bool:
+    if SQL_PROFILING == "on":
+        return True
+    if not SQL_PROFILING_TOKEN:
+        return False
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER.encode():
+            return hmac.compare_digest(value.strip(), SQL_PROFILING_TOKEN.encode())
+    return False
+
+
+class SQLProfilingMiddleware:
+    """
+    ASGI middleware: заводит профиль на время запроса и добавляет
+    X-DB-Queries / X-DB-Time в заголовки ответа.
+
+    Заголовки отправляются до тела ответа, поэтому запросы, сделанные
+    во время потоковой отдачи (/users/export), в них не попадают.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(profile.count).encode()))
+                headers.append((b"x-db-time", f"{profile.total_time * 1000:.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            for statement, count in profile.repeated().items():
+                logger.warning(
+                    "Повторяющийся SQL запрос (%d раз за %s %s), возможен N+1: %s",
+                    count, scope["method"], scope["path"], statement
+                )
@@ -0,0 +1,220 @@
+"""
+Очистка пользователей, удаленных раньше срока восстановления.
+
+Мягко удаленные пользователи (is_active = 0) старше RETENTION_DAYS удаляются
+из users небольшими пачками, каждая в отдельной короткой транзакции, либо
+переносятся в users_archive (RETENTION_MODE=archive).
+
+Запускается фоновой задачей внутри приложения (раз в RETENTION_INTERVAL секунд)
+или вручную: python purge_deleted.py
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+import asyncio
+import logging
+import random
+import threading
+import time
+from sqlalchemy import delete, func, insert, select
+
+from .config import settings
+from . import models
+from .cache import user_cache
+from .changes import PURGED
+from .database import engine
+from .email_filter import email_filter
+
+
+# Сколько дней удаленный профиль можно восстановить (столько же обещает DELETE /profile/)
+RETENTION_DAYS = settings.retention_days
+# delete - удалить строку, archive - перенести в users_archive (без хэша пароля)
+RETENTION_MODE = settings.retention_mode.lower()
+# Интервал фоновой очистки в секундах (0 - фоновая задача выключена, только CLI)
+RETENTION_INTERVAL = settings.retention_interval
+# Строк в одной транзакции
+RETENTION_BATCH_SIZE = settings.retention_batch_size
+# Пауза между пачками, чтобы успевали проходить обычные записи
+RETENTION_BATCH_PAUSE = settings.retention_batch_pause
+# Максимальная длительность одного прохода, остальное - в следующий раз
+RETENTION_MAX_RUN_SECONDS = settings.retention_max_run_seconds
+
+ARCHIVE_FIELDS = (
+    "first_name", "last_name", "middle_name", "email",
+    "deleted_at", "deletion_reason", "created_at", "updated_at",
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _expired(cutoff: datetime):
+    # Условие совпадает с индексом ix_users_is_active_deleted_at
+    return (models.User.is_active == False) & (models.User.deleted_at < cutoff)
+
+
+def count_expired(cutoff: datetime) -> int:
+    with engine.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(models.User).where(_expired(cutoff)))
+
+
+def purge_batch(cutoff: datetime, batch_size: int, mode: str) -> list[tuple[int, str]]:
+    """
+    Одна пачка в отдельной транзакции. Возвращает (id, email) удаленных строк.
+
+    Удаление идет первым оператором транзакции через DELETE ... RETURNING:
+    строки, которые параллельно удалил другой воркер, просто не вернутся,
+    и в архив ничего не попадет дважды.
+    """
+    batch = (
+        select(models.User.id)
+        .where(_expired(cutoff))
+        .order_by(models.User.deleted_at)
+        .limit(batch_size)
+    )
+    columns = [models.User.id] + [getattr(models.User, name) for name in ARCHIVE_FIELDS]
+    with engine.begin() as conn:
+        rows = conn.execute(
+            delete(models.User).where(models.User.id.in_(batch)).returning(*columns)
+        ).all()
+        if rows:
+            conn.execute(insert(models.UserChange), [
+                {"user_id": row.id, "operation": PURGED} for row in rows
+            ])
+        if rows and mode == "archive":
+            conn.execute(insert(models.ArchivedUser), [
+                {"user_id": row.id, **{name: getattr(row, name) for name in ARCHIVE_FIELDS}}
+                for row in rows
+            ])
+    return [(row.id, row.email) for row in rows]
+
+
+def purge_expired_users(
+        retention_days: int = RETENTION_DAYS,
+        mode: str = RETENTION_MODE,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        pause: float = RETENTION_BATCH_PAUSE,
+        max_seconds: float = RETENTION_MAX_RUN_SECONDS,
+        progress: Optional[Callable[[int, int], None]] = None,
+        stop: Optional[threading.Event] = None,
+) -> dict:
+    """
+    Удаляет (или архивирует) пользователей, удаленных больше retention_days назад.
+
+    Работает пачками по batch_size, пока не кончатся строки, не истечет
+    max_seconds или не будет выставлен stop. progress(обработано, всего)
+    вызывается после каждой пачки.
+    """
+    if mode not in ("delete", "archive"):
+        raise ValueError(f"Неизвестный RETENTION_MODE: {mode}")
+
+    started = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    total = count_expired(cutoff)
+    purged = 0
+    batches = 0
+
+    while purged < total:
+        if stop is not None and stop.is_set():
+            break
+        if max_seconds and time.monotonic() - started >= max_seconds:
+            break
+        removed = purge_batch(cutoff, batch_size, mode)
+        if not removed:
+            break
+        batches += 1
+        purged += len(removed)
+        for user_id, email in removed:
+            user_cache.invalidate(user_id)
+            email_filter.discard(email)
+        if progress is not None:
+            progress(purged, total)
+        if pause:
+            time.sleep(pause)
+
+    return {
+        "mode": mode,
+        "cutoff": cutoff.isoformat(),
+        "expired": total,
+        "purged": purged,
+        "batches": batches,
+        "remaining": max(total - purged, 0),
+        "duration_s": round(time.monotonic() - started, 3),
+    }
+
+
+class RetentionJob:
+    """
+    Фоновая задача приложения: периодически вызывает purge_expired_users
+    в отдельном потоке
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.runs = 0
+        self.purged = 0
+        self.errors = 0
+        self.last_run: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._stop.clear()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """
+        Останавливает задачу; начатая пачка дописывается до конца
+        """
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self):
+        # Случайная задержка первого прохода разносит воркеры по времени
+        await asyncio.sleep(random.uniform(0, min(self.interval, 300)))
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        run = asyncio.ensure_future(asyncio.to_thread(
+            purge_expired_users, progress=self._log_progress, stop=self._stop
+        ))
+        try:
+            # shield: при остановке приложения дожидаемся текущей пачки,
+            # а не бросаем поток посреди транзакции
+            result = await asyncio.shield(run)
+        except asyncio.CancelledError:
+            await asyncio.wait([run])
+            raise
+        except Exception:
+            self.errors += 1
+            logger.exception("Ошибка очистки удаленных пользователей")
+            return
+        self.runs += 1
+        self.purged += result["purged"]
+        self.last_run = result
+        logger.info("Очистка удаленных пользователей: %s", result)
+
+    @staticmethod
+    def _log_progress(purged: int, total: int):
+        logger.info("Очистка удаленных пользователей: %d из %d", purged, total)
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "purged": self.purged,
+            "errors": self.errors,
+            "last_run": self.last_run,
+        }
+
+
+retention_job = RetentionJob(RETENTION_INTERVAL)
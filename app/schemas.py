@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field, validator
 from typing import Optional
 from datetime import datetime
+from enum import Enum
 import re
 
 
@@ -46,6 +47,38 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+# Одно изменение из журнала GET /users/changes
+class UserChange(BaseModel):
+    seq: int
+    user_id: int
+    operation: str
+    changed_at: datetime
+    # Текущее состояние пользователя (None, если он уже удален из базы)
+    user: Optional[UserResponse] = None
+
+
+class UserChangesResponse(BaseModel):
+    changes: list[UserChange]
+    # Передается в since следующего запроса
+    last_seq: int
+
+
+# Результат регистрации одного пользователя из пакета
+class BatchRegisterItem(BaseModel):
+    index: int
+    email: str
+    created: bool
+    user: Optional[UserResponse] = None
+    error: Optional[str] = None
+
+
+# Ответ пакетной регистрации
+class BatchRegisterResponse(BaseModel):
+    created: int
+    failed: int
+    results: list[BatchRegisterItem]
+
+
 # Для обновления профиля (частичное обновление)
 class UserUpdate(BaseModel):
     first_name: Optional[str] = Field(None, min_length=2, max_length=100)
@@ -143,7 +176,8 @@ class UserDeleteResponse(BaseModel):
     user_id: int
     email: str
     can_be_restored: bool
-    restore_period_days: int = 30
+    # Через столько дней профиль удаляется окончательно (RETENTION_DAYS)
+    restore_period_days: int
     deleted_at: Optional[datetime] = None
 
 
@@ -162,4 +196,10 @@ class UserDeleteRequest(BaseModel):
 
 class UserLogin(BaseModel):
     email: EmailStr = Field(..., examples=["user@example.com"])
-    password: str = Field(..., examples=["MyPassword123"])
\ No newline at end of file
+    password: str = Field(..., examples=["MyPassword123"])
+
+
+# Формат потоковой выгрузки пользователей
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
@@ -0,0 +1,89 @@
+"""
+Поиск пользователей по имени и email: SQLite FTS5 с триграммным токенайзером.
+
+users_fts - external content таблица поверх users (сами данные не дублируются,
+хранится только индекс). Индекс поддерживается триггерами, поэтому в синхронизации
+остаются все пути записи: ORM, пакетная регистрация, сырой SQL и другие воркеры.
+"""
+from typing import Optional
+from sqlalchemy import Float, text
+from .export import EXPORT_COLUMNS, EXPORT_FIELDS
+
+# Триграммный индекс не находит слова короче трех символов
+MIN_TERM_LENGTH = 3
+
+SEARCH_COLUMNS = ("first_name", "last_name", "middle_name", "email")
+
+_columns = ", ".join(SEARCH_COLUMNS)
+_new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+_old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+
+SEARCH_DDL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        {_columns}, content='users', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+    END""",
+    # Срабатывает только когда меняются индексируемые поля
+    f"""CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF {_columns} ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        INSERT INTO users_fts(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+)
+
+
+def search_supported(engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+def ensure_search_index(engine):
+    """
+    Создает индекс и триггеры, если их еще нет. Для существующей базы
+    индекс один раз перестраивается по всем строкам users
+    """
+    if not search_supported(engine):
+        return
+    with engine.begin() as conn:
+        exists = conn.scalar(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'"))
+        for statement in SEARCH_DDL:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            conn.exec_driver_sql("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+def match_expression(q: str) -> Optional[str]:
+    """
+    Запрос FTS5: каждое слово - отдельная фраза (подстрока в любом из полей),
+    все слова обязательны. Кавычки экранируются, поэтому синтаксис FTS5
+    из пользовательского ввода не интерпретируется.
+    """
+    terms = [term for term in q.split() if len(term) >= MIN_TERM_LENGTH]
+    if not terms:
+        return None
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search_statement(include_inactive: bool, after_cursor: bool):
+    """
+    Пользователи, подходящие под :match, по убыванию релевантности (bm25).
+
+    Keyset-пагинация по паре (rank, id): параметры :rank и :last_id -
+    значения последней строки предыдущей страницы.
+    """
+    conditions = ["users_fts MATCH :match"]
+    if not include_inactive:
+        conditions.append("users.is_active = 1")
+    if after_cursor:
+        conditions.append("(users_fts.rank > :rank OR (users_fts.rank = :rank AND users.id > :last_id))")
+    columns = ", ".join(f"users.{field}" for field in EXPORT_FIELDS)
+    return text(
+        f"SELECT {columns}, users_fts.rank AS rank "
+        f"FROM users_fts JOIN users ON users.id = users_fts.rowid "
+        f"WHERE {' AND '.join(conditions)} "
+        f"ORDER BY users_fts.rank, users.id "
+        f"LIMIT :limit"
+    ).columns(*EXPORT_COLUMNS, rank=Float)
@@ -0,0 +1,88 @@
+"""
+Объединение одновременных одинаковых чтений (single-flight).
+
+Когда популярного пользователя (или холодную запись кэша) одновременно читают
+много запросов одного воркера, SQL запрос выполняет только первый из них,
+остальные ждут его и получают тот же результат.
+
+Результат разделяется между запросами, поэтому загрузчик должен возвращать
+неизменяемые данные (UserSnapshot, Row), а не ORM-объекты своей сессии.
+"""
+from collections import Counter
+from typing import Awaitable, Callable, Hashable, TypeVar
+import asyncio
+from .config import settings
+
+# false - каждый запрос выполняет свой SQL (для сравнения в бенчмарке)
+SINGLE_FLIGHT_ENABLED = settings.single_flight_enabled
+
+T = TypeVar("T")
+
+
+class _Abandoned(Exception):
+    """Первый запрос отменен (клиент отключился) до получения результата"""
+
+
+class SingleFlight:
+    """
+    Ключ - кортеж, первый элемент которого - вид чтения (для статистики).
+
+    В ключ нужно включать все, от чего зависит результат: движок сессии
+    (реплика или основная база) и счетчик инвалидаций кэша - запрос после
+    изменения профиля не присоединяется к чтению, начатому до него.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.executed = Counter()
+        self.coalesced = Counter()
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: tuple, load: Callable[[], Awaitable[T]]) -> T:
+        kind = key[0]
+        if self.enabled:
+            while True:
+                call = self._calls.get(key)
+                if call is None:
+                    break
+                try:
+                    result = await asyncio.shield(call)
+                except _Abandoned:
+                    # Читаем сами (или присоединяемся к следующему запросу)
+                    continue
+                self.coalesced[kind] += 1
+                return result
+
+        self.executed[kind] += 1
+        if not self.enabled:
+            return await load()
+
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        try:
+            result = await load()
+        except asyncio.CancelledError:
+            call.set_exception(_Abandoned())
+            # Ожидающих может не быть - не выводим "exception was never retrieved"
+            call.exception()
+            raise
+        except Exception as exc:
+            call.set_exception(exc)
+            call.exception()
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "executed": dict(self.executed),
+            "coalesced": dict(self.coalesced),
+            "in_flight": len(self._calls),
+        }
+
+
+user_lookups = SingleFlight(SINGLE_FLIGHT_ENABLED)
@@ -0,0 +1,149 @@
+from typing import Optional
+import math
+import threading
+import time
+from fastapi import HTTPException, Request, status
+from .config import settings
+
+
+THROTTLE_ENABLED = settings.throttle_enabled
+# Попыток входа в минуту и размер "пачки" для одного email
+THROTTLE_EMAIL_PER_MINUTE = settings.throttle_email_per_minute
+THROTTLE_EMAIL_BURST = settings.throttle_email_burst
+# То же для одного IP-адреса клиента
+THROTTLE_IP_PER_MINUTE = settings.throttle_ip_per_minute
+THROTTLE_IP_BURST = settings.throttle_ip_burst
+# Максимум отслеживаемых ключей в каждой таблице
+THROTTLE_MAX_KEYS = settings.throttle_max_keys
+# Брать IP из X-Forwarded-For (только за доверенным прокси)
+THROTTLE_TRUST_FORWARDED = settings.throttle_trust_forwarded
+
+
+class TokenBucketLimiter:
+    """
+    Набор token bucket'ов, по одному на ключ.
+
+    Для каждого ключа хранится только кортеж (токены, время обновления).
+    Полностью восстановившиеся ведра ничем не отличаются от отсутствующих,
+    поэтому периодическая чистка их удаляет.
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int, sweep_interval: float = 60.0):
+        self.rate = per_minute / 60.0
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def _tokens(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        tokens, updated = bucket
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def retry_after(self, key: str, now: float) -> float:
+        """
+        Через сколько секунд появится токен (0 - уже есть)
+        """
+        tokens = self._tokens(key, now)
+        if tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (1 - tokens) / self.rate
+
+    def consume(self, key: str, now: float):
+        self._buckets[key] = (self._tokens(key, now) - 1, now)
+        if len(self._buckets) > self.max_keys or now >= self._next_sweep:
+            self.sweep(now)
+
+    def sweep(self, now: float):
+        self._next_sweep = now + self.sweep_interval
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if self._tokens(key, now) < self.burst
+        }
+        # Если активных ключей все равно слишком много, забываем самые старые
+        overflow = len(self._buckets) - self.max_keys
+        if overflow > 0:
+            for key in list(self._buckets)[:overflow]:
+                del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class LoginThrottle:
+    """
+    Ограничение попыток проверки пароля по email и по IP клиента
+    """
+
+    def __init__(self):
+        self.by_email = TokenBucketLimiter(THROTTLE_EMAIL_PER_MINUTE, THROTTLE_EMAIL_BURST, THROTTLE_MAX_KEYS)
+        self.by_ip = TokenBucketLimiter(THROTTLE_IP_PER_MINUTE, THROTTLE_IP_BURST, THROTTLE_MAX_KEYS)
+        self.allowed = 0
+        self.rejected_email = 0
+        self.rejected_ip = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, email: str, ip: Optional[str]) -> float:
+        """
+        Списывает попытку. Возвращает 0, если попытка разрешена,
+        иначе - через сколько секунд можно повторить
+        """
+        email = email.strip().lower()
+        ip = ip or "unknown"
+        with self._lock:
+            now = time.monotonic()
+            email_wait = self.by_email.retry_after(email, now)
+            ip_wait = self.by_ip.retry_after(ip, now)
+            if email_wait or ip_wait:
+                if email_wait:
+                    self.rejected_email += 1
+                else:
+                    self.rejected_ip += 1
+                return max(email_wait, ip_wait)
+
+            self.by_email.consume(email, now)
+            self.by_ip.consume(ip, now)
+            self.allowed += 1
+            return 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": THROTTLE_ENABLED,
+                "allowed": self.allowed,
+                "rejected_email": self.rejected_email,
+                "rejected_ip": self.rejected_ip,
+                "tracked_emails": len(self.by_email),
+                "tracked_ips": len(self.by_ip),
+            }
+
+
+login_throttle = LoginThrottle()
+
+
+def client_ip(request: Request) -> Optional[str]:
+    if THROTTLE_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+def throttle_password_attempt(request: Request, email: str):
+    """
+    Отклоняет попытку с 429 до любого хэширования, если бюджет исчерпан
+    """
+    if not THROTTLE_ENABLED:
+        return
+    wait = login_throttle.acquire(email, client_ip(request))
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много попыток входа, повторите позже",
+            headers={"Retry-After": str(max(1, math.ceil(min(wait, 86400))))},
+        )
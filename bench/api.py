@@ -0,0 +1,210 @@
+"""
+Нагрузочный бенчмарк API: пропускная способность и p50/p95/p99 по эндпоинтам.
+
+Приложение запускается либо внутри процесса (httpx + ASGITransport),
+либо настоящим процессом uvicorn. Результат пишется в JSON, чтобы
+прогоны на разных коммитах можно было сравнить через bench.compare.
+
+Запуск:
+    python -m bench.api --target inprocess --users 1000 --requests 200 --output base.json
+    python -m bench.api --target uvicorn --concurrency 32 --output new.json
+    python -m bench.compare base.json new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from bench.common import use_temp_database, seed_users, summarize
+
+PASSWORD = "BenchPassw0rd"
+ENDPOINTS = ["register", "login", "profile_read", "profile_update", "users_list", "user_by_id"]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_requests(users: int, tokens: list[str]):
+    """
+    Для каждого эндпоинта - функция, строящая i-й запрос воркера worker
+    (метод, путь, kwargs)
+    """
+    run_id = random.randrange(10**9)
+
+    def auth(i):
+        return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+    return {
+        "register": lambda i, worker: ("POST", "/register/", {"json": {
+            "first_name": "Bench", "last_name": "User",
+            "email": f"new{run_id}-{i}@example.com",
+            "password": PASSWORD, "password_repeat": PASSWORD,
+        }}),
+        "login": lambda i, worker: ("POST", "/login/", {"json": {
+            "email": f"user{i % users}@example.com", "password": PASSWORD,
+        }}),
+        "profile_read": lambda i, worker: ("GET", "/profile/", {"headers": auth(i)}),
+        # У каждого воркера свой пользователь: одновременные PATCH одного профиля
+        # конфликтуют по profile_version (409)
+        "profile_update": lambda i, worker: ("PATCH", "/profile/", {
+            "headers": auth(worker), "json": {"first_name": random.choice(["Ivan", "Petr", "Anna"])},
+        }),
+        "users_list": lambda i, worker: ("GET", "/users/", {"params": {"limit": 100}}),
+        "user_by_id": lambda i, worker: ("GET", f"/users/{random.randint(1, users)}", {}),
+    }
+
+
+async def run_endpoint(client, build_request, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    # 409 - ожидаемый исход параллельных изменений, считается отдельно от ошибок
+    conflicts = 0
+    counter = iter(range(total))
+
+    async def worker(worker_id: int):
+        nonlocal errors, conflicts
+        for i in counter:
+            method, path, kwargs = build_request(i, worker_id)
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code == 409:
+                conflicts += 1
+            elif response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(worker_id) for worker_id in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        **summarize(latencies),
+        "errors": errors,
+        "conflicts": conflicts,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+async def run_all(client, args, tokens) -> dict:
+    builders = make_requests(args.users, tokens)
+    results = {}
+    for name in args.endpoints:
+        # Логин и регистрация упираются в bcrypt - для них отдельный объем
+        total = args.hash_requests if name in ("register", "login") else args.requests
+        results[name] = await run_endpoint(client, builders[name], total, args.concurrency)
+        print(f"{name}: {results[name]}", file=sys.stderr)
+    return results
+
+
+async def run_inprocess(args, tokens) -> dict:
+    import httpx
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_all(client, args, tokens)
+
+
+async def run_uvicorn(args, tokens) -> dict:
+    import httpx
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=os.environ.copy()
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("uvicorn не запустился")
+                await asyncio.sleep(0.2)
+            return await run_all(client, args, tokens)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--target", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--users", type=int, default=1000, help="пользователей в базе")
+    parser.add_argument("--requests", type=int, default=500, help="запросов на эндпоинт")
+    parser.add_argument("--hash-requests", type=int, default=50,
+                        help="запросов для register и login (bcrypt)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--output", help="куда записать JSON (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    use_temp_database()
+    # Бенчмарк намеренно делает много логинов с одного адреса
+    os.environ["THROTTLE_ENABLED"] = "false"
+
+    started = time.perf_counter()
+    seed_users(args.users, password=PASSWORD)
+    seeded_in = time.perf_counter() - started
+
+    from app.auth import create_access_token
+    tokens = [create_access_token(data={"sub": str(i + 1)}) for i in range(min(args.users, 100))]
+
+    runner = run_inprocess if args.target == "inprocess" else run_uvicorn
+    results = asyncio.run(runner(args, tokens))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "target": args.target,
+            "users": args.users,
+            "requests": args.requests,
+            "hash_requests": args.hash_requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers if args.target == "uvicorn" else 1,
+            "seeded_in_s": round(seeded_in, 2),
+        },
+        "endpoints": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Общие помощники для бенчмарков.
+
+Важно: use_temp_database() нужно вызывать до импорта app.*,
+так как движок БД создается при импорте app.database.
+"""
+import os
+import statistics
+import tempfile
+
+
+def use_temp_database(name: str = "bench.db") -> str:
+    """
+    Направляет приложение на временную SQLite базу и возвращает путь к ней
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), name)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return path
+
+
+def seed_users(
+        count: int,
+        password: str = "BenchPassw0rd",
+        prefix: str = "user",
+        inactive_every: int = 0,
+        chunk_size: int = 10_000
+) -> str:
+    """
+    Быстро создает count пользователей с одним заранее посчитанным хэшем.
+
+    inactive_every=N делает неактивным каждого N-го пользователя.
+
+    Возвращает email шаблон вида "{prefix}{i}@example.com".
+    """
+    from app import models
+    from app.auth import get_password_hash
+    from app.database import engine
+    from app.migrations import migrate
+
+    migrate(engine)
+    hashed_password = get_password_hash(password)
+    with engine.begin() as conn:
+        for start in range(0, count, chunk_size):
+            rows = [
+                {
+                    "first_name": "Bench",
+                    "last_name": "User",
+                    "email": f"{prefix}{i}@example.com",
+                    "hashed_password": hashed_password,
+                    "is_active": inactive_every == 0 or i % inactive_every != 0,
+                }
+                for i in range(start, min(start + chunk_size, count))
+            ]
+            conn.execute(models.User.__table__.insert(), rows)
+    return prefix + "{}@example.com"
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies) -> dict:
+    """
+    Латентности в секундах -> сводка в миллисекундах
+    """
+    return {
+        "count": len(latencies),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
@@ -0,0 +1,58 @@
+"""
+Сравнение двух отчетов bench.api.
+
+Запуск:
+    python -m bench.compare base.json new.json [--threshold 10]
+
+Код возврата 1, если p99 или пропускная способность какого-либо
+эндпоинта ухудшились больше чем на threshold процентов.
+"""
+import argparse
+import json
+import sys
+
+
+def _change(old: float, new: float) -> float:
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="допустимое ухудшение, %%")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"{base['meta']['commit']} -> {new['meta']['commit']}")
+    print(f"{'endpoint':<16}{'p99, ms':>22}{'Δ p99':>10}{'rps':>22}{'Δ rps':>10}")
+
+    regressed = False
+    for name, new_stats in new["endpoints"].items():
+        base_stats = base["endpoints"].get(name)
+        if base_stats is None:
+            continue
+        p99_change = _change(base_stats["p99_ms"], new_stats["p99_ms"])
+        rps_change = _change(base_stats["throughput_rps"], new_stats["throughput_rps"])
+        flag = ""
+        if p99_change > args.threshold or -rps_change > args.threshold:
+            regressed = True
+            flag = "  <- регрессия"
+        print(
+            f"{name:<16}"
+            f"{base_stats['p99_ms']:>10.2f} -> {new_stats['p99_ms']:>8.2f}{p99_change:>+9.1f}%"
+            f"{base_stats['throughput_rps']:>10.1f} -> {new_stats['throughput_rps']:>8.1f}{rps_change:>+9.1f}%"
+            f"{flag}"
+        )
+
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
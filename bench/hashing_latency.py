@@ -0,0 +1,78 @@
+"""
+p99 латентности GET /profile/ пока логины нагружают пул хэширования.
+
+Запуск:
+    python -m bench.hashing_latency --logins 8 --duration 5
+    HASHING_POOL_SIZE=0 python -m bench.hashing_latency   # bcrypt в event loop
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bench.common import use_temp_database, seed_users, summarize
+
+
+async def run(args):
+    import httpx
+    from app.main import app
+    from app.auth import create_access_token
+    from app.hashing import hashing_executor
+    from app.database import dispose_engines
+
+    email_template = seed_users(args.users)
+    token = create_access_token(data={"sub": "1"})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    transport = httpx.ASGITransport(app=app)
+    deadline = time.perf_counter() + args.duration
+    profile_latencies = []
+    login_statuses = {}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login_loop(worker: int):
+            email = email_template.format(worker % args.users)
+            while time.perf_counter() < deadline:
+                response = await client.post(
+                    "/login/", json={"email": email, "password": "BenchPassw0rd"}
+                )
+                login_statuses[response.status_code] = login_statuses.get(response.status_code, 0) + 1
+
+        async def profile_loop():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.get("/profile/", headers=headers)
+                response.raise_for_status()
+                profile_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(args.interval)
+
+        await asyncio.gather(profile_loop(), *(login_loop(i) for i in range(args.logins)))
+
+    hashing_executor.shutdown()
+    await dispose_engines()
+    return {
+        "hashing_pool_size": hashing_executor.max_workers,
+        "hashing_queue_size": hashing_executor.max_pending,
+        "concurrent_logins": args.logins,
+        "login_statuses": login_statuses,
+        "profile": summarize(profile_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--logins", type=int, default=8, help="одновременных логинов")
+    parser.add_argument("--duration", type=float, default=5.0, help="секунд")
+    parser.add_argument("--interval", type=float, default=0.01, help="пауза между чтениями профиля")
+    args = parser.parse_args()
+
+    use_temp_database()
+    # Бенчмарк намеренно перегружает /login/ с одного адреса
+    os.environ.setdefault("THROTTLE_ENABLED", "false")
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
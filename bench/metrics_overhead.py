@@ -0,0 +1,100 @@
+"""
+Накладные расходы сбора метрик.
+
+Прогоняет bench.api на дешевых эндпоинтах (там, где overhead заметнее всего)
+с METRICS_ENABLED=false и METRICS_ENABLED=true и сравнивает результаты.
+Дополнительно замеряет чистую стоимость записи метрик одного запроса
+(middleware + несколько SQL запросов) - она не зависит от шума нагрузки.
+
+Запуск:
+    python -m bench.metrics_overhead --requests 2000 --rounds 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ENDPOINTS = ["user_by_id", "users_list", "profile_read"]
+
+
+def run_api(metrics_enabled: bool, args) -> dict:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output = f.name
+    try:
+        subprocess.run(
+            [sys.executable, "-m", "bench.api", "--endpoints", *ENDPOINTS,
+             "--users", str(args.users), "--requests", str(args.requests),
+             "--concurrency", str(args.concurrency), "--output", output],
+            env={**os.environ, "METRICS_ENABLED": "true" if metrics_enabled else "false"},
+            check=True, capture_output=True
+        )
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)["endpoints"]
+    finally:
+        os.unlink(output)
+
+
+def instrumentation_cost_us(iterations: int = 100_000, queries_per_request: int = 2) -> float:
+    """
+    Сколько микросекунд добавляет запись метрик на один запрос
+    """
+    from app import metrics
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        metrics.http_requests_in_flight.inc()
+        request_started = time.perf_counter()
+        for _ in range(queries_per_request):
+            query_started = time.perf_counter()
+            metrics.db_queries_total.inc("async")
+            metrics.db_query_duration_seconds.observe(time.perf_counter() - query_started, "async")
+            metrics.db_pool_wait_seconds.observe(0.0001, "async")
+        metrics.http_requests_in_flight.dec()
+        metrics.http_requests_total.inc("GET", "/users/{user_id}", 200)
+        metrics.http_request_duration_seconds.observe(
+            time.perf_counter() - request_started, "GET", "/users/{user_id}"
+        )
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3, help="берется лучший из прогонов")
+    args = parser.parse_args()
+
+    best = {False: {}, True: {}}
+    # Прогоны чередуются, чтобы фоновые колебания нагрузки делились поровну
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            for name, stats in run_api(enabled, args).items():
+                if stats["throughput_rps"] > best[enabled].get(name, {}).get("throughput_rps", 0):
+                    best[enabled][name] = stats
+
+    report = {}
+    for name in ENDPOINTS:
+        off, on = best[False][name], best[True][name]
+        report[name] = {
+            "rps_without_metrics": off["throughput_rps"],
+            "rps_with_metrics": on["throughput_rps"],
+            "p99_ms_without_metrics": off["p99_ms"],
+            "p99_ms_with_metrics": on["p99_ms"],
+            "throughput_overhead_pct": round((off["throughput_rps"] - on["throughput_rps"])
+                                             / off["throughput_rps"] * 100, 2),
+        }
+    cost = instrumentation_cost_us()
+    report["instrumentation_cost_per_request_us"] = round(cost, 2)
+    for name in ENDPOINTS:
+        report[name]["instrumentation_share_of_p50_pct"] = round(
+            cost / 1000 / best[True][name]["p50_ms"] * 100, 3
+        )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
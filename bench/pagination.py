@@ -0,0 +1,86 @@
+"""
+Сравнение OFFSET и keyset (cursor) пагинации GET /users/.
+
+Замеряет первую и глубокую (по умолчанию 10 000-ю) страницу на таблице
+из миллиона пользователей.
+
+Запуск:
+    python -m bench.pagination --rows 1000000 --page 10000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench.common import use_temp_database, seed_users, summarize
+
+
+async def measure(client, params, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await client.get("/users/", params=params)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+async def run(args):
+    import httpx
+    from app.main import app
+    from app.pagination import encode_cursor
+    from app.database import engine, dispose_engines
+    from app import models
+    from sqlalchemy import select
+
+    started = time.perf_counter()
+    seed_users(args.rows, inactive_every=args.inactive_every)
+    seeded_in = time.perf_counter() - started
+
+    skip = (args.page - 1) * args.limit
+    # id последнего активного пользователя перед нужной страницей -
+    # именно его клиент получил бы в X-Next-Cursor предыдущей страницы
+    with engine.connect() as conn:
+        last_id = conn.scalar(
+            select(models.User.id)
+            .where(models.User.is_active == True)
+            .order_by(models.User.id)
+            .offset(skip - 1)
+            .limit(1)
+        )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = {
+            "offset_page_1": await measure(client, {"limit": args.limit}, args.repeat),
+            f"offset_page_{args.page}": await measure(
+                client, {"limit": args.limit, "skip": skip}, args.repeat
+            ),
+            "cursor_page_1": await measure(
+                client, {"limit": args.limit, "cursor": encode_cursor(0)}, args.repeat
+            ),
+            f"cursor_page_{args.page}": await measure(
+                client, {"limit": args.limit, "cursor": encode_cursor(last_id)}, args.repeat
+            ),
+        }
+
+    await dispose_engines()
+    return {"rows": args.rows, "limit": args.limit, "seeded_in_s": round(seeded_in, 2), **results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--page", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--inactive-every", type=int, default=50,
+                        help="каждый N-й пользователь неактивен (0 - все активны)")
+    args = parser.parse_args()
+
+    use_temp_database()
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Чтение списка пользователей: ORM + UserResponse против Core select + orjson.
+
+orm  - прежний путь GET /users/: select(User) загружает полные ORM-объекты,
+       FastAPI валидирует каждый через UserResponse (from_attributes)
+       и сериализует результат через json.dumps
+core - текущий путь: select() только колонок ответа, строки-кортежи
+       сериализуются напрямую через orjson
+
+Каждый замер - как в обработчике запроса: новая сессия из get_db, запрос к БД
+и сериализация. Перед замером проверяется, что JSON совпадает.
+
+Запуск:
+    python -m bench.read_path --rows 20000 --limits 100 1000 --repeat 50
+"""
+import argparse
+import asyncio
+import json
+import time
+from contextlib import aclosing
+
+from bench.common import use_temp_database, seed_users, summarize
+
+
+def _starlette_json(content) -> bytes:
+    # То же, что делает JSONResponse.render
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+async def run(args):
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from app import models, schemas
+    from app.database import get_db, dispose_engines
+    from app.export import EXPORT_COLUMNS, rows_to_json
+
+    started = time.perf_counter()
+    seed_users(args.rows)
+    seeded_in = time.perf_counter() - started
+
+    adapter = TypeAdapter(list[schemas.UserResponse])
+
+    async def orm_path(db, limit):
+        query = select(models.User).where(models.User.is_active == True).order_by(models.User.id).limit(limit)
+        users = (await db.scalars(query)).all()
+        validated = adapter.validate_python(users, from_attributes=True)
+        return _starlette_json(adapter.dump_python(validated, mode="json"))
+
+    async def core_path(db, limit):
+        query = select(*EXPORT_COLUMNS).where(models.User.is_active == True).order_by(models.User.id).limit(limit)
+        rows = (await db.execute(query)).all()
+        return rows_to_json(rows)
+
+    async def request(path, limit):
+        async with aclosing(get_db()) as sessions:
+            async for db in sessions:
+                return await path(db, limit)
+
+    results = {}
+    for limit in args.limits:
+        orm_body = await request(orm_path, limit)
+        core_body = await request(core_path, limit)
+        assert json.loads(orm_body) == json.loads(core_body), "ответы различаются"
+
+        for name, path in (("orm", orm_path), ("core", core_path)):
+            latencies = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                await request(path, limit)
+                latencies.append(time.perf_counter() - started)
+            results[f"{name}_limit_{limit}"] = summarize(latencies)
+
+        speedup = results[f"orm_limit_{limit}"]["p50_ms"] / results[f"core_limit_{limit}"]["p50_ms"]
+        results[f"speedup_p50_limit_{limit}"] = round(speedup, 2)
+
+    await dispose_engines()
+    return {"rows": args.rows, "repeat": args.repeat, "seeded_in_s": round(seeded_in, 2), **results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--limits", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    use_temp_database()
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
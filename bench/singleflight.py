@@ -0,0 +1,94 @@
+"""
+Single-flight: одновременные чтения одного и того же пользователя.
+
+Каждый раунд - --concurrency одновременных запросов к одному пользователю
+при холодном кэше: GET /users/{id}, GET /profile/ и POST /login/.
+Прогоны без объединения и с ним чередуются; в отчете - сколько чтений
+выполнили SQL запрос, сколько получили результат чужого запроса,
+и латентность запросов.
+
+Запуск:
+    python -m bench.singleflight --concurrency 64 --rounds 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bench.common import use_temp_database, seed_users, summarize
+
+PASSWORD = "BenchPassw0rd"
+
+
+async def run(args):
+    import httpx
+    from app.main import app
+    from app.auth import create_access_token
+    from app.cache import user_cache
+    from app.hashing import hashing_executor
+    from app.database import dispose_engines
+    from app.singleflight import user_lookups
+
+    email = seed_users(args.users, password=PASSWORD).format(0)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': '1'})}"}
+
+    requests = {
+        "user_by_id": lambda client: client.get("/users/1"),
+        "profile_read": lambda client: client.get("/profile/", headers=headers),
+        "login": lambda client: client.post("/login/", json={"email": email, "password": PASSWORD}),
+    }
+    kinds = {"user_by_id": "user", "profile_read": "current_user", "login": "login"}
+    report = {name: {} for name in requests}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def timed(request):
+            started = time.perf_counter()
+            response = await request(client)
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        for name, request in requests.items():
+            kind = kinds[name]
+            results = {False: [], True: []}
+            counts = {False: [0, 0], True: [0, 0]}
+            # Прогоны чередуются, чтобы фоновые колебания нагрузки делились поровну
+            for _ in range(args.rounds):
+                for enabled in (False, True):
+                    user_lookups.enabled = enabled
+                    user_cache.clear()
+                    executed, coalesced = user_lookups.executed[kind], user_lookups.coalesced[kind]
+                    results[enabled] += await asyncio.gather(*(timed(request) for _ in range(args.concurrency)))
+                    counts[enabled][0] += user_lookups.executed[kind] - executed
+                    counts[enabled][1] += user_lookups.coalesced[kind] - coalesced
+
+            for enabled, label in ((False, "without_single_flight"), (True, "with_single_flight")):
+                report[name][label] = {
+                    "executed": counts[enabled][0],
+                    "coalesced": counts[enabled][1],
+                    **summarize(results[enabled]),
+                }
+
+    hashing_executor.shutdown()
+    await dispose_engines()
+    return {"concurrency": args.concurrency, "rounds": args.rounds, **report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременных запросов в раунде")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    use_temp_database()
+    # Все логины идут к одному email с одного адреса; bcrypt не должен заслонять SELECT
+    os.environ.setdefault("THROTTLE_ENABLED", "false")
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    os.environ.setdefault("HASHING_QUEUE_SIZE", str(args.concurrency * 2))
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
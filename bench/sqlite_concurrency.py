@@ -0,0 +1,121 @@
+"""
+Пропускная способность SQLite при параллельных чтениях и записях.
+
+Сравнивает настройки SQLite по умолчанию (rollback journal, synchronous=FULL)
+с профилем приложения (WAL, synchronous=NORMAL, busy_timeout и т.д.).
+Каждый профиль запускается в отдельном процессе, так как настройки
+движка читаются при импорте app.database.
+
+Запуск:
+    python -m bench.sqlite_concurrency --readers 8 --writers 4 --duration 5
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from bench.common import use_temp_database, seed_users
+
+PROFILES = {
+    "default": {"SQLITE_PRAGMAS": "false"},
+    "tuned": {"SQLITE_PRAGMAS": "true"},
+}
+
+
+def run_workload(args) -> dict:
+    from sqlalchemy import select, update
+    from sqlalchemy.exc import OperationalError
+    from app import models
+    from app.database import engine
+
+    seed_users(args.users)
+    deadline = time.perf_counter() + args.duration
+    counters = {"reads": 0, "writes": 0, "locked_errors": 0}
+    lock = threading.Lock()
+
+    def count(name):
+        with lock:
+            counters[name] += 1
+
+    def reader():
+        rnd = random.Random()
+        while time.perf_counter() < deadline:
+            start_id = rnd.randint(1, max(args.users - 50, 1))
+            try:
+                with engine.connect() as conn:
+                    conn.execute(
+                        select(models.User.id, models.User.email)
+                        .where(models.User.id.between(start_id, start_id + 50))
+                    ).fetchall()
+                count("reads")
+            except OperationalError:
+                count("locked_errors")
+
+    def writer():
+        rnd = random.Random()
+        while time.perf_counter() < deadline:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(models.User)
+                        .where(models.User.id == rnd.randint(1, args.users))
+                        .values(first_name=f"Name{rnd.randint(0, 10**6)}")
+                    )
+                count("writes")
+            except OperationalError:
+                count("locked_errors")
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {
+        **counters,
+        "reads_per_s": round(counters["reads"] / args.duration, 1),
+        "writes_per_s": round(counters["writes"] / args.duration, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--profile", choices=[*PROFILES, "both"], default="both")
+    args = parser.parse_args()
+
+    if args.profile != "both":
+        use_temp_database()
+        print(json.dumps(run_workload(args)))
+        return
+
+    results = {}
+    for profile, profile_env in PROFILES.items():
+        env = {
+            **os.environ,
+            **profile_env,
+            "DATABASE_ASYNC": "false",
+            "DB_POOL_SIZE": str(args.readers + args.writers),
+        }
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.sqlite_concurrency", "--profile", profile,
+             "--users", str(args.users), "--readers", str(args.readers),
+             "--writers", str(args.writers), "--duration", str(args.duration)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Время холодного старта: импорт app.main, lifespan (прогрев) и первые запросы.
+
+Каждый прогон - отдельный процесс Python, поэтому импорт действительно холодный.
+Код возврата 1, если медиана "импорт + старт + первые запросы" больше бюджета.
+
+Запуск:
+    python -m bench.startup --runs 5 --budget-ms 3000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bench.common import use_temp_database, seed_users
+
+PASSWORD = "BenchPassw0rd"
+
+# Выполняется в дочернем процессе; печатает длительности этапов в мс
+CHILD = """
+import asyncio, json, sys, time
+import httpx
+
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+
+async def main():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            assert (await client.get("/health/ready")).status_code == 200
+            login_started = time.perf_counter()
+            response = await client.post("/login/", json={"email": sys.argv[1], "password": sys.argv[2]})
+            assert response.status_code == 200, response.text
+            login_done = time.perf_counter()
+            assert (await client.get("/users/")).status_code == 200
+            list_done = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "startup_ms": (ready - imported) * 1000,
+        "first_login_ms": (login_done - login_started) * 1000,
+        "first_list_ms": (list_done - login_done) * 1000,
+    }))
+
+
+asyncio.run(main())
+"""
+
+PHASES = ("import_ms", "startup_ms", "first_login_ms", "first_list_ms")
+
+
+def run_once(email: str) -> dict:
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, email, PASSWORD],
+        capture_output=True, text=True, check=True, env=os.environ.copy(),
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["total_ms"] = sum(result[phase] for phase in PHASES)
+    # Вместе с запуском интерпретатора
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--budget-ms", type=float, default=3000,
+                        help="бюджет на импорт + старт + первые запросы (медиана)")
+    args = parser.parse_args()
+
+    use_temp_database()
+    email = seed_users(args.users, password=PASSWORD).format(0)
+
+    runs = [run_once(email) for _ in range(args.runs)]
+    report = {
+        key: round(statistics.median(run[key] for run in runs), 1)
+        for key in (*PHASES, "total_ms", "process_ms")
+    }
+    report["budget_ms"] = args.budget_ms
+    print(json.dumps(report, indent=2))
+
+    if report["total_ms"] > args.budget_ms:
+        print(f"Бюджет старта превышен: {report['total_ms']} мс > {args.budget_ms} мс", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
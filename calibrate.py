@@ -0,0 +1,42 @@
+"""
+Подбор стоимости bcrypt под текущее железо.
+
+Запуск:
+    python calibrate.py --target-ms 250
+
+Выводит время проверки пароля для каждой стоимости и рекомендуемое
+значение BCRYPT_ROUNDS. Существующие хэши с другой стоимостью
+перехэшируются автоматически при следующем входе пользователя.
+"""
+import argparse
+
+from app.auth import BCRYPT_ROUNDS, calibrate_bcrypt_rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250.0,
+                        help="допустимое время проверки пароля, мс")
+    parser.add_argument("--min-rounds", type=int, default=4)
+    parser.add_argument("--max-rounds", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=3, help="замеров на каждую стоимость")
+    args = parser.parse_args()
+
+    rounds, timings = calibrate_bcrypt_rounds(
+        args.target_ms, args.min_rounds, args.max_rounds, args.samples
+    )
+
+    print(f"{'rounds':>6}{'verify, ms':>14}")
+    for cost, elapsed in timings.items():
+        marker = "  <- текущее" if cost == BCRYPT_ROUNDS else ""
+        print(f"{cost:>6}{elapsed:>14.1f}{marker}")
+
+    if timings[rounds] > args.target_ms:
+        print(f"\nДаже минимальная стоимость {rounds} не укладывается в {args.target_ms:.0f} мс")
+    print(f"\nBCRYPT_ROUNDS={rounds}")
+    if rounds != BCRYPT_ROUNDS:
+        print(f"(сейчас используется {BCRYPT_ROUNDS})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,52 @@
+"""
+Применение миграций схемы к базе из DATABASE_URL.
+
+Запуск:
+    python migrate.py              # применить все новые миграции
+    python migrate.py --list       # состояние миграций
+    python migrate.py --target 4   # применить миграции до версии 4 включительно
+
+run.py применяет миграции перед запуском воркеров, приложение - только
+при MIGRATE_ON_STARTUP=true. Скрипт нужен, чтобы выполнить долгие шаги
+(индексы, заполнение данных) заранее, до выкладки, или при запуске через uvicorn напрямую.
+"""
+import argparse
+
+from sqlalchemy import select
+
 from app.database import engine
-from app.models import Base
-import sqlite3
+from app.migrations import MIGRATIONS, migrate, pending_migrations, schema_migrations
 
 
-def migrate():
-    # Создаем таблицы заново (осторожно: удалит существующие данные!)
-    # Base.metadata.drop_all(bind=engine)  # Раскомментировать для пересоздания
-    Base.metadata.create_all(bind=engine)
+def show_status():
+    pending = {item.version for item in pending_migrations(engine)}
+    with engine.connect() as conn:
+        applied = {row.version: row for row in conn.execute(select(schema_migrations))}
+    for item in sorted(MIGRATIONS, key=lambda m: m.version):
+        if item.version in pending:
+            print(f"{item.version:04d}  ожидает            {item.name}")
+        else:
+            row = applied[item.version]
+            print(f"{item.version:04d}  {row.applied_at:%Y-%m-%d %H:%M}  {item.name} ({row.duration_ms:.1f} мс)")
 
-    # Альтернативный способ - ALTER TABLE через raw SQL
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
 
-    try:
-        # Добавляем новые поля если их нет
-        cursor.execute("ALTER TABLE users ADD COLUMN deleted_at TIMESTAMP")
-        print("Added deleted_at column")
-    except sqlite3.OperationalError:
-        print("Column deleted_at already exists")
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--list", action="store_true", help="показать примененные и ожидающие миграции")
+    parser.add_argument("--target", type=int, default=None, help="последняя применяемая версия")
+    args = parser.parse_args()
 
-    try:
-        cursor.execute("ALTER TABLE users ADD COLUMN deletion_reason TEXT")
-        print("Added deletion_reason column")
-    except sqlite3.OperationalError:
-        print("Column deletion_reason already exists")
+    if args.list:
+        show_status()
+        return
 
-    conn.commit()
-    conn.close()
-    print("Migration completed!")
+    applied = migrate(engine, target=args.target, log=lambda message: print(message, flush=True))
+    if not applied:
+        print("Новых миграций нет")
+        return
+    total = sum(item["duration_ms"] for item in applied)
+    print(f"Применено миграций: {len(applied)}, {total:.1f} мс")
 
 
 if __name__ == "__main__":
-    migrate()
+    main()
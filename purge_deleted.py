@@ -0,0 +1,52 @@
+"""
+Очистка пользователей, удаленных больше RETENTION_DAYS дней назад.
+
+Запуск:
+    python purge_deleted.py                   # по настройкам из .env
+    python purge_deleted.py --days 30 --mode archive --batch-size 500
+    python purge_deleted.py --dry-run         # только посчитать
+
+Работает пачками в отдельных коротких транзакциях, поэтому его можно
+запускать на работающей базе. Без --max-seconds обрабатывает все строки.
+"""
+import argparse
+import json
+from datetime import datetime, timedelta
+
+from app.retention import (
+    RETENTION_BATCH_PAUSE, RETENTION_BATCH_SIZE, RETENTION_DAYS, RETENTION_MODE,
+    count_expired, purge_expired_users
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="срок хранения удаленных, дней")
+    parser.add_argument("--mode", choices=["delete", "archive"], default=RETENTION_MODE)
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=RETENTION_BATCH_PAUSE, help="пауза между пачками, с")
+    parser.add_argument("--max-seconds", type=float, default=0, help="ограничение по времени (0 - без ограничения)")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, сколько строк будет обработано")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        cutoff = datetime.utcnow() - timedelta(days=args.days)
+        print(f"Удалены раньше {cutoff.isoformat()}: {count_expired(cutoff)}")
+        return
+
+    def progress(purged, total):
+        print(f"{purged}/{total}", flush=True)
+
+    result = purge_expired_users(
+        retention_days=args.days,
+        mode=args.mode,
+        batch_size=args.batch_size,
+        pause=args.pause,
+        max_seconds=args.max_seconds,
+        progress=progress,
+    )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,85 @@
+"""
+Запуск сервера.
+
+    python run.py                      # production: несколько воркеров
+    python run.py --workers 4 --port 8080
+    python run.py --dev                # разработка: один процесс с автоперезагрузкой
+
+Настройки берутся из аргументов, а если они не заданы - из переменных окружения
+(см. .env.example).
+"""
+import argparse
+import importlib.util
+import os
 import uvicorn
 
-if __name__ == "__main__":
+from app.config import settings
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def apply_migrations():
+    """
+    Миграции применяются один раз до запуска воркеров, а не в каждом из них
+    (и не при импорте приложения)
+    """
+    from app.database import engine
+    from app.migrations import migrate
+
+    migrate(engine, log=lambda message: print(message, flush=True))
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dev", action="store_true", default=settings.server_mode.lower() == "dev",
+                        help="режим разработки: один процесс и автоперезагрузка")
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument("--workers", type=int, default=settings.web_concurrency or os.cpu_count() or 1)
+    parser.add_argument("--keep-alive", type=int, default=settings.server_keep_alive, help="таймаут keep-alive, с")
+    parser.add_argument("--backlog", type=int, default=settings.server_backlog)
+    parser.add_argument("--limit-concurrency", type=int, default=settings.server_limit_concurrency,
+                        help="максимум одновременных запросов на воркер (0 - без ограничения)")
+    parser.add_argument("--graceful-timeout", type=int, default=settings.server_graceful_timeout,
+                        help="ожидание начатых запросов при остановке, с")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false", default=settings.server_access_log)
+    args = parser.parse_args()
+
+    apply_migrations()
+
+    if args.dev:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            reload=True
+        )
+        return
+
+    # uvloop и httptools быстрее стандартных asyncio и h11, но необязательны
+    loop = "uvloop" if _installed("uvloop") else "asyncio"
+    http = "httptools" if _installed("httptools") else "h11"
+    print(f"Воркеров: {args.workers}, цикл событий: {loop}, HTTP: {http}", flush=True)
+
+    # По SIGTERM/SIGINT воркеры перестают принимать соединения, дожидаются
+    # начатых запросов (не дольше graceful-timeout) и выполняют lifespan shutdown
     uvicorn.run(
         "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency or None,
+        timeout_graceful_shutdown=args.graceful_timeout or None,
+        access_log=args.access_log,
     )
+
+
+if __name__ == "__main__":
+    main()
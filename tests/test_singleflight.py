@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+CONCURRENCY = 50
+
+
+def test_concurrent_lookups_share_one_load():
+    flight = SingleFlight()
+    loads = 0
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.05)
+        return {"id": 1}
+
+    async def main():
+        return await asyncio.gather(*(flight.do(("user", 1), load) for _ in range(CONCURRENCY)))
+
+    results = asyncio.run(main())
+
+    assert loads == 1
+    assert flight.executed["user"] == 1
+    assert flight.coalesced["user"] == CONCURRENCY - 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.01)
+        return object()
+
+    async def main():
+        return await asyncio.gather(flight.do(("user", 1), load), flight.do(("user", 2), load))
+
+    first, second = asyncio.run(main())
+
+    assert first is not second
+    assert flight.executed["user"] == 2
+    assert flight.coalesced["user"] == 0
+
+
+def test_leader_error_is_raised_in_every_follower():
+    flight = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.05)
+        raise ValueError("db is down")
+
+    async def main():
+        return await asyncio.gather(
+            *(flight.do(("user", 1), load) for _ in range(CONCURRENCY)), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.executed["user"] == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_leader_hands_over_to_followers():
+    flight = SingleFlight()
+    loads = 0
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.1)
+        return loads
+
+    async def main():
+        leader = asyncio.create_task(flight.do(("user", 1), load))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.do(("user", 1), load)) for _ in range(CONCURRENCY - 1)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.wait_for(asyncio.gather(*followers), timeout=5)
+
+    results = asyncio.run(main())
+
+    # Один из ожидавших выполнил чтение заново, остальные получили его результат
+    assert loads == 2
+    assert results == [2] * (CONCURRENCY - 1)
+    assert flight.executed["user"] == 2
+    assert flight.coalesced["user"] == CONCURRENCY - 2
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_disabled_layer_runs_every_load():
+    flight = SingleFlight(enabled=False)
+
+    async def load():
+        await asyncio.sleep(0.01)
+        return 1
+
+    async def main():
+        return await asyncio.gather(*(flight.do(("user", 1), load) for _ in range(10)))
+
+    asyncio.run(main())
+
+    assert flight.executed["user"] == 10
+    assert flight.coalesced["user"] == 0